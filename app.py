@@ -1,9 +1,11 @@
-from fastapi import FastAPI, Query, Response, HTTPException
+from fastapi import FastAPI, Query, Request, Response, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.triggers.cron import CronTrigger
 from contextlib import asynccontextmanager
+import asyncio
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import datetime
@@ -11,12 +13,26 @@ import logging
 import sys
 import os
 import json
+import hashlib
+import threading
+import time
+import orjson
+from email.utils import format_datetime, parsedate_to_datetime
 
 # Import custom modules
 import db_init
-import scrape_teater_ee
-import scrape_concert_ee
+import db_pool
+import event_cache
+import snapshots
+import metrics
+import ics_feed
+import event_pages
+import event_export
+import event_search
+import scraper_base
 import cleanup_non_events
+import event_dedup
+import archive_events
 
 # Setup Logging
 logging.basicConfig(
@@ -35,42 +51,108 @@ APP_STATE = {
     "events_clean": 0,
     "events_adults": 0,
     "last_teater_status": 0,
-    "last_teater_blocked": False
+    "last_teater_blocked": False,
+    "sources": {},
+    "source_durations": {},
+    "db_pool": {},
+    "db_pool_refresh": {},
+    "events_cache": {},
+    "snapshots": {},
+    "feeds": {}
 }
 
+# Event window results, dropped whenever refresh_data finishes
+EVENTS_CACHE = event_cache.EventCache(
+    max_size=int(os.getenv("EVENTS_CACHE_SIZE", event_cache.EVENTS_CACHE_SIZE_DEFAULT)),
+    ttl=float(os.getenv("EVENTS_CACHE_TTL", event_cache.EVENTS_CACHE_TTL_DEFAULT))
+)
+
+# Pre-encoded bodies of the standard windows, rebuilt by refresh_data
+SNAPSHOTS = snapshots.SnapshotStore(lambda: EVENTS_CACHE.generation)
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", snapshots.SNAPSHOT_MAX_AGE_DEFAULT))
+
+# Compressed calendar feeds, unfiltered ones rebuilt by refresh_data
+FEEDS = ics_feed.FeedStore(int(os.getenv("ICS_FEED_CACHE_SIZE", ics_feed.ICS_FEED_CACHE_SIZE_DEFAULT)))
+ICS_FEED_MAX_AGE = int(os.getenv("ICS_FEED_MAX_AGE", ics_feed.ICS_FEED_MAX_AGE_DEFAULT))
+
+# Whether idx_events_search_trgm exists (pg_trgm installed); None until the
+# next search checks, reset after every init_db
+SEARCH_TRIGRAM = None
+
+# Async pool for the API handlers, opened in lifespan
+ASYNC_DB_POOL = None
+_async_db_pool_lock = asyncio.Lock()
+
+# Sync pool for the refresh job, which runs in the scheduler's thread
+DB_POOL = None
+_db_pool_lock = threading.Lock()
+
+async def get_async_db_pool():
+    global ASYNC_DB_POOL
+    if ASYNC_DB_POOL is None:
+        async with _async_db_pool_lock:
+            if ASYNC_DB_POOL is None:
+                if not os.getenv("DATABASE_URL"):
+                    logger.error("DATABASE_URL_MISSING: true")
+                pool = db_pool.create_async_pool()
+                await pool.open()
+                ASYNC_DB_POOL = pool
+    return ASYNC_DB_POOL
+
+def get_db_pool():
+    global DB_POOL
+    if DB_POOL is None:
+        with _db_pool_lock:
+            if DB_POOL is None:
+                if not os.getenv("DATABASE_URL"):
+                    logger.error("DATABASE_URL_MISSING: true")
+                DB_POOL = db_pool.create_pool()
+    return DB_POOL
+
 def get_db_connection():
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url:
-        logger.error("DATABASE_URL_MISSING: true")
-        raise Exception("DATABASE_URL environment variable is not set")
-    return psycopg2.connect(db_url, cursor_factory=RealDictCursor)
+    return get_db_pool().connection()
+
+def apply_event_stats(rows):
+    for row in rows:
+        if row["name"] in ("events_total", "events_clean", "events_adults"):
+            APP_STATE[row["name"]] = row["value"]
+            metrics.EVENTS.set(row["value"], set=row["name"].removeprefix("events_"))
 
 def update_health_stats(conn=None):
     try:
-        close_conn = False
         if not conn:
-            conn = get_db_connection()
-            close_conn = True
+            with get_db_connection() as conn:
+                return update_health_stats(conn)
             
+        # Counts are precomputed by db_init.refresh_views()
         with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM events")
-            APP_STATE["events_total"] = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM v_events_clean")
-            APP_STATE["events_clean"] = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM v_events_clean_adults")
-            APP_STATE["events_adults"] = cur.fetchone()[0]
+            cur.execute("SELECT name, value FROM event_stats")
+            apply_event_stats(cur.fetchall())
             
         APP_STATE["db_ok"] = True
-        
-        if close_conn:
-            conn.close()
     except Exception as e:
         logger.error(f"Health stats update failed: {e}")
         APP_STATE["db_ok"] = False
 
+def record_source_metrics(name: str, stats: dict):
+    if stats.get("blocked"):
+        result = "blocked"
+    elif stats.get("error"):
+        result = "error"
+    else:
+        result = "ok"
+    metrics.SCRAPE_RUNS.inc(source=name, result=result)
+    for outcome in ("parsed", "inserted", "updated", "unchanged", "filtered"):
+        metrics.SCRAPE_EVENTS.inc(stats.get(outcome, 0), source=name, outcome=outcome)
+    # A timed-out run has no stage timings, only its duration
+    for stage, seconds in stats.get("timings", {}).items():
+        metrics.SOURCE_STAGES.observe(seconds, source=name, stage=stage)
+    if stats.get("duration") is not None:
+        metrics.SOURCE_STAGES.observe(stats["duration"], source=name, stage="total")
+
 def refresh_data():
+    global SEARCH_TRIGRAM
+    started = time.monotonic()
     APP_STATE["last_refresh_started_at"] = datetime.datetime.now().isoformat()
     logger.info("--- STARTED: Scheduled Data Refresh ---")
     
@@ -79,39 +161,66 @@ def refresh_data():
     try:
         # 1. Ensure DB/Views
         try:
-            db_init.init_db()
+            with metrics.REFRESH_STAGES.time(stage="init_db"):
+                db_init.init_db()
             APP_STATE["db_ok"] = True
         except Exception:
             APP_STATE["db_ok"] = False
+        finally:
+            # pg_trgm may have been installed (or the index dropped) meanwhile
+            SEARCH_TRIGRAM = None
         
-        # 2. Scrape Teater.ee
-        t_stats = scrape_teater_ee.run_scraper()
-        logger.info(f"Teater.ee: {t_stats}")
-        
-        APP_STATE["last_teater_status"] = t_stats.get("status", 0)
-        APP_STATE["last_teater_blocked"] = t_stats.get("blocked", False)
-        
-        if t_stats.get("blocked"):
-            logger.info("TEATER_BLOCKED_FALLBACK: true")
-        
-        parsed_total += t_stats.get("parsed", 0)
-        
-        # 3. Scrape Concert.ee
-        c_stats = scrape_concert_ee.run_scraper()
-        logger.info(f"Concert.ee: {c_stats}")
-        parsed_total += c_stats.get("parsed", 0)
+        # 2. Scrape every registered source, in parallel
+        scrape_started = scraper_base.timestamp()
+        with metrics.REFRESH_STAGES.time(stage="scrape"):
+            results = scraper_base.run_sources(scraper_base.load_sources())
+        for name, stats in results.items():
+            logger.info(f"{name}: {stats}")
+            APP_STATE["sources"][name] = stats
+            APP_STATE["source_durations"][name] = stats.get("duration")
+            record_source_metrics(name, stats)
+            
+            if name == "teater.ee":
+                APP_STATE["last_teater_status"] = stats.get("status", 0)
+                APP_STATE["last_teater_blocked"] = stats.get("blocked", False)
+                
+                if stats.get("blocked"):
+                    logger.info("TEATER_BLOCKED_FALLBACK: true")
+            
+            parsed_total += stats.get("parsed", 0)
         
-        # 4. Cleanup (Safe Mode)
+        # 3. Cleanup (Safe Mode)
         # Only cleanup if we actually successfully parsed data OR if it's not a block scenario
         # If both scrapers failed/blocked (parsed=0), we might want to skip cleanup to avoid wiping out logic
-        cl_stats = cleanup_non_events.run_cleanup(check_safety=True, parsed_count=parsed_total)
+        with metrics.REFRESH_STAGES.time(stage="cleanup"):
+            cl_stats = cleanup_non_events.run_cleanup(
+                check_safety=True, parsed_count=parsed_total, watermark=scrape_started
+            )
         logger.info(f"Cleanup: {cl_stats}")
-        
-        # Update view stats
-        update_health_stats()
+
+        # 3b. Same event listed by several sources: keep one in the views
+        with metrics.REFRESH_STAGES.time(stage="dedup"):
+            dedup_stats = event_dedup.run_dedup()
+        logger.info(f"Dedup: {dedup_stats}")
+
+        # 4. Materialized views (DB_MATERIALIZED_VIEWS=1) and event_stats
+        with metrics.REFRESH_STAGES.time(stage="stats"):
+            db_init.refresh_views()
         
     except Exception as e:
         logger.error(f"Refresh failed: {e}")
+    finally:
+        # Data may have changed even if a later step failed
+        EVENTS_CACHE.invalidate()
+        APP_STATE["events_cache"] = EVENTS_CACHE.stats()
+
+    with metrics.REFRESH_STAGES.time(stage="snapshots"):
+        build_snapshots()
+        build_feeds()
+
+    # Update view stats
+    update_health_stats()
+    metrics.REFRESH_STAGES.observe(time.monotonic() - started, stage="total")
     
     APP_STATE["last_refresh_finished_at"] = datetime.datetime.now().isoformat()
     logger.info("--- FINISHED: Data Refresh ---")
@@ -119,6 +228,13 @@ def refresh_data():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    try:
+        pool = await get_async_db_pool()
+        logger.info(f"DB_POOL_READY: min={pool.min_size} max={pool.max_size}")
+    except Exception as e:
+        # Endpoints retry lazily through get_async_db_pool()
+        logger.error(f"DB pool init failed: {e}")
+
     scheduler_enabled = os.getenv("SCHEDULER_ENABLED", "1") == "1"
     
     if scheduler_enabled:
@@ -129,6 +245,8 @@ async def lifespan(app: FastAPI):
         # Run slightly delayed to allow server start
         scheduler.add_job(refresh_data, 'date', run_date=datetime.datetime.now() + datetime.timedelta(seconds=5))
         scheduler.add_job(refresh_data, IntervalTrigger(minutes=60))
+        # Old monthly partitions to disk (no-op unless events is partitioned)
+        scheduler.add_job(archive_events.run_archive, CronTrigger(hour=4, minute=30))
         
         scheduler.start()
     else:
@@ -139,137 +257,467 @@ async def lifespan(app: FastAPI):
     if scheduler_enabled:
         scheduler.shutdown()
 
+    if ASYNC_DB_POOL is not None:
+        await ASYNC_DB_POOL.close()
+    if DB_POOL is not None:
+        DB_POOL.close()
+
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-def query_events(start_date: str, end_date: str, show_kids: bool):
-    try:
-        conn = get_db_connection()
-        view = "v_events_clean" if show_kids else "v_events_clean_adults"
-        
-        with conn.cursor() as cur:
-            query = f"""
-                SELECT * FROM {view}
-                WHERE date BETWEEN %s AND %s
-                ORDER BY date ASC, time ASC
-            """
-            cur.execute(query, (start_date, end_date))
+def events_view(show_kids: bool):
+    return "v_events_clean" if show_kids else "v_events_clean_adults"
+
+def events_query(view: str):
+    return f"""
+        SELECT * FROM {view}
+        WHERE date BETWEEN %s AND %s
+        ORDER BY date ASC, time ASC
+    """
+
+def fetch_events(start_date: str, end_date: str, show_kids: bool):
+    # Blocking variant, used by refresh_data in the scheduler thread
+    view = events_view(show_kids)
+    cache_key = (view, str(start_date), str(end_date))
+
+    cached = EVENTS_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = EVENTS_CACHE.generation
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        with metrics.DB_QUERIES.time(query="events_window_refresh"):
+            cur.execute(events_query(view), (start_date, end_date))
             rows = cur.fetchall()
-            result = [dict(row) for row in rows]
-            
-        conn.close()
-        return result
+        result = [dict(row) for row in rows]
+        
+    EVENTS_CACHE.put(cache_key, result, generation)
+    return result
+
+async def fetch_events_async(start_date: str, end_date: str, show_kids: bool):
+    view = events_view(show_kids)
+    cache_key = (view, str(start_date), str(end_date))
+
+    cached = EVENTS_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = EVENTS_CACHE.generation
+
+    pool = await get_async_db_pool()
+    async with pool.connection() as conn:
+        with metrics.DB_QUERIES.time(query="events_window"):
+            cur = await conn.execute(events_query(view), (start_date, end_date))
+            result = await cur.fetchall()
+
+    EVENTS_CACHE.put(cache_key, result, generation)
+    return result
+
+async def query_events(start_date: str, end_date: str, show_kids: bool):
+    try:
+        return await fetch_events_async(start_date, end_date, show_kids)
     except Exception as e:
         logger.error(f"Query failed: {e}")
         return []
 
+def build_snapshot(window: str, show_kids: bool):
+    start, end = snapshots.window_bounds(window)
+    rows = fetch_events(start.isoformat(), end.isoformat(), show_kids)
+    return snapshots.build_snapshot(rows, start)
+
+async def build_snapshot_async(window: str, show_kids: bool):
+    start, end = snapshots.window_bounds(window)
+    rows = await fetch_events_async(start.isoformat(), end.isoformat(), show_kids)
+    return snapshots.build_snapshot(rows, start)
+
+def build_snapshots():
+    built = {}
+    for window in snapshots.WINDOWS:
+        for show_kids in (False, True):
+            try:
+                built[(window, show_kids)] = build_snapshot(window, show_kids)
+            except Exception as e:
+                # Missing entries are rebuilt on the next request
+                logger.error(f"Snapshot {window} (show_kids={show_kids}) failed: {e}")
+    SNAPSHOTS.replace(built)
+    APP_STATE["snapshots"] = SNAPSHOTS.stats()
+
+def feed_key(window: str, show_kids: bool, genre: str = None, city: str = None):
+    return (window, show_kids, (genre or "").strip().lower() or None, (city or "").strip().lower() or None)
+
+def build_feed(rows, window: str, genre: str = None, city: str = None):
+    rows = ics_feed.filter_rows(rows, genre, city)
+    return ics_feed.build_feed(rows, datetime.date.today(), ics_feed.feed_name(window, genre, city))
+
+def build_feeds():
+    # Same rows as the snapshots, so this reads EVENTS_CACHE, not the database
+    built = {}
+    for window in snapshots.WINDOWS:
+        for show_kids in (False, True):
+            try:
+                start, end = snapshots.window_bounds(window)
+                rows = fetch_events(start.isoformat(), end.isoformat(), show_kids)
+                built[feed_key(window, show_kids)] = build_feed(rows, window)
+            except Exception as e:
+                logger.error(f"Feed {window} (show_kids={show_kids}) failed: {e}")
+    FEEDS.replace(built)
+    APP_STATE["feeds"] = FEEDS.stats()
+
+def http_date(value: datetime.datetime):
+    # updated_at is naive UTC (scraper_base.timestamp); build times are
+    # already aware
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return format_datetime(value.replace(microsecond=0), usegmt=True)
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime.datetime = None):
+    # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return parsedate_to_datetime(http_date(last_modified)) <= since
+    return False
+
+def accepts_gzip(request: Request):
+    # Accept-Encoding with q-values (RFC 9110 12.5.3): "gzip;q=0" refuses
+    # gzip, and "*" covers it when gzip is not listed
+    qualities = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+def conditional_response(request: Request, body, media_type: str, etag: str,
+                         last_modified: datetime.datetime = None, headers: dict = None):
+    headers = dict(headers or {})
+    headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if is_not_modified(request, etag, last_modified):
+        headers.pop("Content-Disposition", None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+async def window_response(request: Request, window: str, show_kids: bool):
+    snap = SNAPSHOTS.get(window, show_kids)
+    if snap is None:
+        generation = EVENTS_CACHE.generation
+        try:
+            snap = await build_snapshot_async(window, show_kids)
+        except Exception as e:
+            logger.error(f"Query failed: {e}")
+            return Response(content=b"[]", media_type="application/json", headers={"Cache-Control": "no-store"})
+        SNAPSHOTS.put(window, show_kids, snap, generation)
+
+    return conditional_response(
+        request, snap.body, "application/json", snap.etag, snap.last_modified,
+        headers={"Cache-Control": f"public, max-age={SNAPSHOT_MAX_AGE}"}
+    )
+
 @app.get("/health")
-def health_check():
+async def health_check():
     # Update DB stats on demand if needed, or rely on scheduler
     # Let's verify DB connection real-time for accuracy
     try:
-        conn = get_db_connection()
-        conn.close()
-        APP_STATE["db_ok"] = True
-    except:
+        pool = await get_async_db_pool()
+        async with pool.connection() as conn:
+            await conn.execute("SELECT 1")
+            APP_STATE["db_ok"] = True
+            try:
+                # O(1) lookups, so workers without the scheduler report counts too
+                cur = await conn.execute("SELECT name, value FROM event_stats")
+                apply_event_stats(await cur.fetchall())
+            except Exception as e:
+                logger.error(f"Health stats read failed: {e}")
+    except Exception:
         APP_STATE["db_ok"] = False
+
+    if ASYNC_DB_POOL is not None:
+        APP_STATE["db_pool"] = ASYNC_DB_POOL.get_stats()
+    if DB_POOL is not None:
+        APP_STATE["db_pool_refresh"] = DB_POOL.stats()
+    APP_STATE["events_cache"] = EVENTS_CACHE.stats()
         
     return JSONResponse(content=APP_STATE)
 
+@app.get("/metrics")
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/events/today")
-def get_today(show_kids: bool = False):
-    today = datetime.date.today().isoformat()
-    return query_events(today, today, show_kids)
+async def get_today(request: Request, show_kids: bool = False):
+    return await window_response(request, "today", show_kids)
 
 @app.get("/events/7days")
-def get_7days(show_kids: bool = False):
-    today = datetime.date.today()
-    end = today + datetime.timedelta(days=7)
-    return query_events(today.isoformat(), end.isoformat(), show_kids)
+async def get_7days(request: Request, show_kids: bool = False):
+    return await window_response(request, "7days", show_kids)
 
 @app.get("/events/14days")
-def get_14days(show_kids: bool = False):
-    today = datetime.date.today()
-    end = today + datetime.timedelta(days=14)
-    return query_events(today.isoformat(), end.isoformat(), show_kids)
+async def get_14days(request: Request, show_kids: bool = False):
+    return await window_response(request, "14days", show_kids)
 
 @app.get("/events/30days")
-def get_30days(show_kids: bool = False):
-    today = datetime.date.today()
-    end = today + datetime.timedelta(days=30)
-    return query_events(today.isoformat(), end.isoformat(), show_kids)
+async def get_30days(request: Request, show_kids: bool = False):
+    return await window_response(request, "30days", show_kids)
 
 @app.get("/events/search")
-def search_events(start: str, end: str, show_kids: bool = False):
-    return query_events(start, end, show_kids)
+async def search_events(request: Request, start: str, end: str, show_kids: bool = False):
+    rows = await query_events(start, end, show_kids)
+    snap = snapshots.build_snapshot(rows, None)
+    # Built per request, so the ETag is the only validator
+    return conditional_response(
+        request, snap.body, "application/json", snap.etag,
+        headers={"Cache-Control": "no-cache"}
+    )
+
+async def stream_rows(sql, params, name, itersize=None):
+    # Rows from a server-side cursor (fetched itersize at a time), so memory
+    # stays flat however many rows match; holds one pooled connection
+    pool = await get_async_db_pool()
+    async with pool.connection() as conn:
+        async with conn.transaction():
+            async with conn.cursor(name=name) as cur:
+                if itersize:
+                    cur.itersize = itersize
+                await cur.execute(sql, params)
+                async for row in cur:
+                    yield row
+
+async def primed_stream(chunks):
+    """
+    Pull the first chunk before the response starts, so a failing query is
+    still answered with a proper error status instead of a cut-off 200.
+    """
+    try:
+        first = await anext(chunks)
+    except Exception as e:
+        logger.error(f"Stream query failed: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+    return body()
+
+def parse_date_param(name: str, value: str):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} date, expected YYYY-MM-DD")
+
+async def page_body(rows, fields, limit):
+    # The first row is awaited before anything is yielded (see primed_stream)
+    row = await anext(rows, None)
+    yield b'{"events":['
+    count = 0
+    last = None
+    while row is not None and count < limit:
+        yield (b"," if count else b"") + orjson.dumps({f: row[f] for f in fields})
+        last = row
+        count += 1
+        row = await anext(rows, None)
+    # A row past the limit means there is a next page
+    next_cursor = event_pages.encode_cursor(last) if row is not None else None
+    await rows.aclose()
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b'}'
+
+@app.get("/events/page")
+async def events_page(
+    start: str,
+    end: str,
+    show_kids: bool = False,
+    limit: int = Query(event_pages.PAGE_LIMIT_DEFAULT, ge=1, le=event_pages.PAGE_LIMIT_MAX),
+    cursor: str = None,
+    fields: str = None
+):
+    start_date = parse_date_param("start", start)
+    end_date = parse_date_param("end", end)
+    try:
+        wanted = event_pages.parse_fields(fields)
+        after = event_pages.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    sql, params = event_pages.page_query(events_view(show_kids), wanted, start_date, end_date, after, limit)
+    rows = stream_rows(sql, params, "events_page")
+    body = await primed_stream(page_body(rows, wanted, limit))
+    return StreamingResponse(body, media_type="application/json", headers={"Cache-Control": "no-cache"})
+
+@app.get("/events/export")
+async def export_events(
+    request: Request,
+    start: str,
+    end: str,
+    show_kids: bool = False,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    fields: str = None
+):
+    start_date = parse_date_param("start", start)
+    end_date = parse_date_param("end", end)
+    try:
+        # Exports default to every column
+        wanted = event_pages.parse_fields(fields) if fields else event_pages.FIELDS
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-def ics_escape(text):
-    if not text: return ""
-    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    batch_size = int(os.getenv("EXPORT_BATCH_SIZE", event_export.EXPORT_BATCH_SIZE_DEFAULT))
+    rows = stream_rows(
+        event_export.export_query(events_view(show_kids), wanted), (start_date, end_date),
+        "events_export", itersize=batch_size
+    )
+    chunks = event_export.encode(rows, format, wanted, batch_size)
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f'attachment; filename="events_{start_date}_{end_date}.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if accepts_gzip(request):
+        chunks = event_export.gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    body = await primed_stream(chunks)
+    return StreamingResponse(body, media_type=event_export.FORMATS[format], headers=headers)
+
+async def search_trigram_available(conn):
+    global SEARCH_TRIGRAM
+    if SEARCH_TRIGRAM is None:
+        cur = await conn.execute("SELECT to_regclass('idx_events_search_trgm') IS NOT NULL AS available")
+        SEARCH_TRIGRAM = (await cur.fetchone())["available"]
+    return SEARCH_TRIGRAM
+
+@app.get("/events/find")
+async def find_events(
+    q: str = Query(..., min_length=1, max_length=200),
+    start: str = None,
+    end: str = None,
+    show_kids: bool = False,
+    limit: int = Query(event_search.SEARCH_LIMIT_DEFAULT, ge=1, le=event_search.SEARCH_LIMIT_MAX),
+    fields: str = None
+):
+    # Upcoming year by default, like the SPA's widest listing
+    start_date = parse_date_param("start", start) if start else datetime.date.today()
+    end_date = parse_date_param("end", end) if end else start_date + datetime.timedelta(days=365)
+    if event_search.tsquery_text(q) is None:
+        raise HTTPException(status_code=400, detail="Query has no words to search for")
+    try:
+        wanted = event_pages.parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        pool = await get_async_db_pool()
+        async with pool.connection() as conn:
+            sql, params = event_search.search_query(
+                events_view(show_kids), wanted, q, start_date, end_date, limit,
+                trigram=await search_trigram_available(conn)
+            )
+            with metrics.DB_QUERIES.time(query="events_search"):
+                cur = await conn.execute(sql, params)
+                rows = await cur.fetchall()
+    except Exception as e:
+        logger.error(f"Search failed: {e}")
+        raise HTTPException(status_code=503, detail="Database unavailable")
+
+    body = orjson.dumps({"events": [{f: row[f] for f in wanted} for row in rows]})
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-cache"})
+
+@app.get("/events/feed.ics")
+async def events_feed(
+    request: Request,
+    window: str = Query("30days", pattern="^(" + "|".join(snapshots.WINDOWS) + ")$"),
+    genre: str = Query(None, max_length=100),
+    city: str = Query(None, max_length=100),
+    show_kids: bool = False
+):
+    key = feed_key(window, show_kids, genre, city)
+    feed = FEEDS.get(key)
+    if feed is None:
+        generation = FEEDS.generation
+        try:
+            start, end = snapshots.window_bounds(window)
+            rows = await fetch_events_async(start.isoformat(), end.isoformat(), show_kids)
+        except Exception as e:
+            logger.error(f"Feed query failed: {e}")
+            raise HTTPException(status_code=503, detail="Database unavailable")
+        feed = build_feed(rows, window, genre, city)
+        FEEDS.put(key, feed, generation)
+
+    # Each encoding is its own representation, with its own ETag
+    gzipped = accepts_gzip(request)
+    etag = f'"{feed.etag}-gz"' if gzipped else f'"{feed.etag}"'
+    headers = {
+        "Cache-Control": f"public, max-age={ICS_FEED_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+        "ETag": etag,
+    }
+    if feed.last_modified:
+        headers["Last-Modified"] = http_date(feed.last_modified)
+    if is_not_modified(request, etag, feed.last_modified):
+        return Response(status_code=304, headers=headers)
+
+    media_type = "text/calendar; charset=utf-8"
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=feed.gz_body, media_type=media_type, headers=headers)
+    return StreamingResponse(ics_feed.decompressed_chunks(feed.gz_body), media_type=media_type, headers=headers)
 
 @app.get("/events/{event_id}/ics")
-def get_event_ics(event_id: int):
+async def get_event_ics(request: Request, event_id: int):
     try:
-        conn = get_db_connection()
+        pool = await get_async_db_pool()
+        async with pool.connection() as conn:
+            with metrics.DB_QUERIES.time(query="event_by_id"):
+                cur = await conn.execute("SELECT * FROM v_events_clean WHERE id = %s", (event_id,))
+                event = await cur.fetchone()
     except Exception:
         return Response("Database connection failed", status_code=500)
-
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM v_events_clean WHERE id = %s", (event_id,))
-            event = cur.fetchone()
-    finally:
-        conn.close()
     
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    d_obj = event['date']
-    date_str = d_obj.strftime("%Y%m%d")
-    
-    t_obj = event['time']
-    if t_obj:
-        time_str = t_obj.strftime("%H%M%S")
-    else:
-        time_str = "190000"
-    
-    dtstart = f"{date_str}T{time_str}"
-    dtstamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    
-    summary = ics_escape(event['title'])
-    
-    v_parts = []
-    if event['venue']: v_parts.append(event['venue'])
-    if event['city']: v_parts.append(event['city'])
-    location = ics_escape(", ".join(v_parts))
-    
-    desc_lines = []
-    if event['description']: desc_lines.append(event['description'])
-    if event['ticket_url']: desc_lines.append(f"Piletid: {event['ticket_url']}")
-    desc_lines.append(f"Allikas: {event['source_url']}")
-    description = ics_escape("\n\n".join(desc_lines))
-    
-    uid = f"{event['canonical_event_id']}@ag-kultuurivoog"
-    
-    ics_content = [
-        "BEGIN:VCALENDAR",
-        "VERSION:2.0",
-        "PRODID:-//AG Kultuurivoog//ET",
-        "BEGIN:VEVENT",
-        f"UID:{uid}",
-        f"DTSTAMP:{dtstamp}",
-        f"DTSTART;TZID=Europe/Tallinn:{dtstart}",
-        f"SUMMARY:{summary}",
-        f"LOCATION:{location}",
-        f"DESCRIPTION:{description}",
-        f"URL:{event['source_url'] or ''}",
-        "END:VEVENT",
-        "END:VCALENDAR"
-    ]
+    # The calendar entry only changes when the scraper records a real change
+    version = f"{event['canonical_event_id']}:{event['updated_at'].isoformat() if event['updated_at'] else ''}"
+    etag = '"' + hashlib.sha1(version.encode("utf-8")).hexdigest() + '"'
+    if is_not_modified(request, etag, event["updated_at"]):
+        return conditional_response(request, b"", "text/calendar", etag, event["updated_at"])
+
+    # DTSTAMP as in the feeds, so the body stays the same under one ETag
+    dtstamp = ics_feed.utc_stamp(event["updated_at"] or datetime.datetime.now(datetime.timezone.utc))
+    ics_content = ics_feed.calendar([ics_feed.vevent_lines(event, dtstamp)])
     
     print("ICS_ENDPOINT_OK: true")
 
-    return Response(content="\r\n".join(ics_content), media_type="text/calendar", headers={"Content-Disposition": f"attachment; filename=event_{event_id}.ics"})
+    return conditional_response(
+        request, ics_content, "text/calendar", etag, event["updated_at"],
+        headers={"Content-Disposition": f"attachment; filename=event_{event_id}.ics", "Cache-Control": "no-cache"}
+    )
 
 @app.get("/")
 def root():
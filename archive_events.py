@@ -0,0 +1,130 @@
+"""
+Archive old monthly partitions of `events` (DB_PARTITION_EVENTS=1).
+
+Every partition whose month ended more than EVENTS_RETENTION_MONTHS ago is
+written to EVENTS_ARCHIVE_DIR as a gzipped CSV (with header), then detached
+and dropped in the same transaction, so a failed write never loses rows.
+Runs daily from the app scheduler; can also be run by hand:
+
+    python archive_events.py
+"""
+import os
+import re
+import gzip
+import datetime
+
+import db_init
+
+EVENTS_RETENTION_MONTHS_DEFAULT = 3
+EVENTS_ARCHIVE_DIR_DEFAULT = "archive/events"
+
+PARTITION_RE = re.compile(r'^events_p(\d{4})_(\d{2})$')
+
+
+def list_partitions(cur):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'events' AND p.relnamespace = current_schema()::regnamespace
+        ORDER BY c.relname
+    """)
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, datetime.date(int(match.group(1)), int(match.group(2)), 1)))
+    return partitions
+
+
+def archive_partition(cur, name, directory):
+    cur.execute(f"SELECT COUNT(*) FROM {name}")
+    rows = cur.fetchone()[0]
+
+    # Empty months are dropped without leaving a file behind
+    path = None
+    if rows:
+        path = os.path.join(directory, f"{name}.csv.gz")
+        cols = ", ".join(db_init.stored_columns(cur, "events"))
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            cur.copy_expert(f"COPY (SELECT {cols} FROM {name} ORDER BY date, time, id) TO STDOUT WITH CSV HEADER", f)
+
+    cur.execute(f"ALTER TABLE events DETACH PARTITION {name}")
+    cur.execute(f"DROP TABLE {name}")
+    # The file is in place before the caller commits the DROP
+    if path:
+        os.replace(path + ".tmp", path)
+    return path, rows
+
+
+def archive_default_rows(cur, cutoff, directory):
+    # Dates outside the monthly ranges land in events_default; its rows
+    # older than the cutoff go to their own file and are deleted
+    cur.execute("SELECT COUNT(*) FROM events_default WHERE date < %s", (cutoff,))
+    rows = cur.fetchone()[0]
+    if not rows:
+        return None, 0
+
+    path = os.path.join(directory, f"events_default_before_{cutoff:%Y_%m}.csv.gz")
+    cols = ", ".join(db_init.stored_columns(cur, "events"))
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+        cur.copy_expert(cur.mogrify(
+            f"COPY (SELECT {cols} FROM events_default WHERE date < %s ORDER BY date, time, id) TO STDOUT WITH CSV HEADER",
+            (cutoff,)
+        ).decode(), f)
+    cur.execute("DELETE FROM events_default WHERE date < %s", (cutoff,))
+    os.replace(path + ".tmp", path)
+    return path, rows
+
+
+def run_archive(retention_months=None, directory=None):
+    retention_months = retention_months if retention_months is not None else int(
+        os.getenv("EVENTS_RETENTION_MONTHS", EVENTS_RETENTION_MONTHS_DEFAULT)
+    )
+    directory = directory or os.getenv("EVENTS_ARCHIVE_DIR", EVENTS_ARCHIVE_DIR_DEFAULT)
+    # Partitions starting before this month are archived
+    cutoff = db_init.add_months(db_init.month_start(datetime.date.today()), -retention_months)
+
+    conn = db_init.get_db_connection()
+    cur = conn.cursor()
+    archived = []
+    try:
+        if db_init.relation_kind(cur, "events")[0] != "p":
+            print("ARCHIVE_SKIPPED: events is not partitioned")
+            return {"archived": [], "skipped": True}
+
+        os.makedirs(directory, exist_ok=True)
+        for name, month in list_partitions(cur):
+            if month >= cutoff:
+                continue
+            try:
+                path, rows = archive_partition(cur, name, directory)
+                conn.commit()
+            except Exception as e:
+                print(f"ARCHIVE_ERROR: {name}: {e}")
+                conn.rollback()
+                continue
+            print(f"ARCHIVED: {name} ({rows} rows) -> {path or 'dropped, empty'}")
+            archived.append({"partition": name, "rows": rows, "path": path})
+
+        try:
+            path, rows = archive_default_rows(cur, cutoff, directory)
+            conn.commit()
+        except Exception as e:
+            print(f"ARCHIVE_ERROR: events_default: {e}")
+            conn.rollback()
+        else:
+            if rows:
+                print(f"ARCHIVED: events_default ({rows} rows) -> {path}")
+                archived.append({"partition": "events_default", "rows": rows, "path": path})
+    finally:
+        cur.close()
+        conn.close()
+
+    print(f"ARCHIVED_PARTITIONS: {len(archived)}")
+    return {"archived": archived, "skipped": False}
+
+
+if __name__ == "__main__":
+    run_archive()
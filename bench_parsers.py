@@ -0,0 +1,254 @@
+"""
+Offline parser benchmark.
+
+Runs each source's parse pipeline (build_document -> select_blocks ->
+extract_event -> enrich) over the checked-in HTML dumps, scaled up by
+duplicating event blocks, without touching the network or the database.
+
+    python bench_parsers.py
+    python bench_parsers.py --scales 1 10 --repeat 5 --source teater.ee
+    python bench_parsers.py --parser bs4 --parser selectolax
+    python bench_parsers.py --check
+    python bench_parsers.py --output bench_output.txt
+
+--check parses every dump with each installed engine (see html_engine)
+and exits non-zero if bs4 finds no events or any engine's events differ
+from bs4's.
+
+rss_mb is the peak RSS of a fresh process that parses the scaled dump
+once, so the C-side trees of lxml and selectolax count too. It includes
+the interpreter and the imported modules, the same for every row.
+The run fails if a dump parses to no events.
+"""
+import argparse
+import copy
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+
+import html_engine
+import scraper_base
+
+# Source name -> (dump file, selector of the block that gets duplicated)
+FIXTURES = {
+    "teater.ee": ("teater_dump.html", ".post-etendus__item"),
+    "concert.ee": ("concert_dump.html", ".event-list .row"),
+}
+
+SCALES_DEFAULT = [1, 10, 100]
+REPEAT_DEFAULT = 3
+
+STAGES = ["soup", "select", "extract", "classify"]
+
+
+def scale_html(html, selector, factor):
+    """Return `html` with every block matching `selector` repeated `factor` times."""
+    if factor <= 1:
+        return html
+    soup = BeautifulSoup(html, 'html.parser')
+    for block in soup.select(selector):
+        anchor = block
+        for _ in range(factor - 1):
+            clone = copy.copy(block)
+            anchor.insert_after(clone)
+            anchor = clone
+    return str(soup)
+
+
+def run_stages(source, html):
+    timings = {}
+
+    started = time.perf_counter()
+    doc = source.build_document(html)
+    timings["soup"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    items = list(source.select_blocks(doc))
+    timings["select"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    events = []
+    for item in items:
+        try:
+            event = source.extract_event(item)
+        except Exception:
+            continue
+        if event: events.append(event)
+    timings["extract"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    source.enrich(events)
+    timings["classify"] = time.perf_counter() - started
+
+    return len(items), len(events), timings
+
+
+def max_rss():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def rss_probe(name, engine, path):
+    """Child side of peak_memory(): print the peak RSS after one parse."""
+    scraper_base.load_sources()
+    source = scraper_base.SOURCES[name]()
+    source.max_events = None
+    source.html_parser = engine
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    source.enrich(source.parse(html))
+    print(max_rss())
+
+
+def peak_memory(name, engine, html):
+    # A fresh process per measurement: the peak RSS of this one only grows
+    with tempfile.NamedTemporaryFile("w", suffix=".html", encoding="utf-8", delete=False) as f:
+        f.write(html)
+    try:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--rss-probe", name, engine, f.name],
+            capture_output=True, text=True, check=True
+        )
+        return int(result.stdout.split()[-1])
+    finally:
+        os.unlink(f.name)
+
+
+def bench(name, source, html, repeat):
+    # Best of `repeat` per stage, the usual way to cut scheduler noise
+    best = {stage: None for stage in STAGES}
+    blocks = events = 0
+    for _ in range(repeat):
+        blocks, events, timings = run_stages(source, html)
+        for stage, value in timings.items():
+            if best[stage] is None or value < best[stage]:
+                best[stage] = value
+    return {
+        "blocks": blocks,
+        "events": events,
+        "timings": best,
+        "peak_bytes": peak_memory(name, source.html_parser, html),
+    }
+
+
+def check_engines(names, engines):
+    """Return a list of problems, empty when bs4 finds events and all engines agree."""
+    problems = []
+    for name in names:
+        path, _ = FIXTURES[name]
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        source = scraper_base.SOURCES[name]()
+        source.max_events = None
+        source.html_parser = html_engine.PARSER_DEFAULT
+        expected = source.parse(html)
+        if not expected:
+            # Engines that all find nothing agree without checking anything
+            problems.append(f"{name} bs4")
+            print(f"EMPTY    {name:<11} bs4         0 events")
+            continue
+
+        for engine in engines:
+            source.html_parser = engine
+            events = source.parse(html)
+            if events == expected:
+                print(f"OK       {name:<11} {engine:<11} {len(events)} events")
+                continue
+            problems.append(f"{name} {engine}")
+            print(f"MISMATCH {name:<11} {engine:<11} {len(events)} events, bs4 {len(expected)}")
+            for got, want in zip(events, expected):
+                if got != want:
+                    print(f"  first difference:\n    {engine}: {got}\n    bs4: {want}")
+                    break
+    return problems
+
+
+def format_row(name, engine, factor, size, result):
+    total = sum(result["timings"].values())
+    rate = result["events"] / total if total and result["events"] else 0
+    stages = " ".join(f"{result['timings'][s] * 1000:9.2f}" for s in STAGES)
+    return (
+        f"{name:<11} {engine:<11} {factor:>5}x {size / 1024:9.0f} {result['blocks']:>7} {result['events']:>7} "
+        f"{stages} {total * 1000:9.2f} {rate:11.0f} {result['peak_bytes'] / 1024 / 1024:8.1f}"
+    )
+
+
+HEADER = (
+    f"{'source':<11} {'parser':<11} {'scale':>6} {'html_kb':>9} {'blocks':>7} {'events':>7} "
+    + " ".join(f"{s + '_ms':>9}" for s in STAGES)
+    + f" {'total_ms':>9} {'events/sec':>11} {'rss_mb':>8}"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--source", action="append", choices=sorted(FIXTURES),
+                        help="source to benchmark (repeatable, default: all)")
+    parser.add_argument("--parser", action="append", choices=sorted(html_engine.ENGINES),
+                        help="parse engine to benchmark (repeatable, default: all installed)")
+    parser.add_argument("--check", action="store_true",
+                        help="only verify that all engines produce identical events")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES_DEFAULT)
+    parser.add_argument("--repeat", type=int, default=REPEAT_DEFAULT)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--rss-probe", nargs=3, metavar=("SOURCE", "PARSER", "HTML"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.rss_probe:
+        rss_probe(*args.rss_probe)
+        return
+
+    scraper_base.load_sources()
+    names = args.source or sorted(FIXTURES)
+    installed = html_engine.available_engines()
+    engines = [e for e in (args.parser or installed) if e in installed]
+    missing = sorted(set(args.parser or []) - set(installed))
+    if missing:
+        print(f"Not installed, skipped: {', '.join(missing)}")
+
+    if args.check:
+        sys.exit(1 if check_engines(names, engines) else 0)
+
+    lines = [HEADER]
+    print(HEADER)
+    empty = []
+    for name in names:
+        path, selector = FIXTURES[name]
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+
+        source = scraper_base.SOURCES[name]()
+        # Measure every block, not just the production per-page cap
+        source.max_events = None
+
+        for factor in args.scales:
+            scaled = scale_html(html, selector, factor)
+            size = len(scaled.encode("utf-8"))
+            for engine in engines:
+                source.html_parser = engine
+                result = bench(name, source, scaled, args.repeat)
+                if not result["events"]:
+                    empty.append(f"{name} {engine} {factor}x")
+                line = format_row(name, engine, factor, size, result)
+                lines.append(line)
+                print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    if empty:
+        # A fixture without events only times an empty loop
+        print(f"BENCH_NO_EVENTS: {', '.join(empty)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
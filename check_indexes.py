@@ -0,0 +1,155 @@
+"""
+EXPLAIN ANALYZE check for the API's hot queries.
+
+Builds the events table, indexes and views (db_init) in a scratch schema,
+seeds it with N rows (default 1M, mostly past events like a long-running
+production table), then runs the listing, count and lookup queries and
+fails if any of them reads `events` with a sequential scan, or if a keyset
+page query sorts instead of reading in index order.
+
+    DATABASE_URL=... python check_indexes.py
+    DATABASE_URL=... python check_indexes.py --rows 200000 --keep
+
+The scratch schema is dropped afterwards unless --keep is given.
+"""
+import argparse
+import datetime
+import json
+import sys
+
+import db_init
+import event_pages
+import event_search
+
+SCHEMA_DEFAULT = "index_check"
+ROWS_DEFAULT = 1_000_000
+
+# Same shape as app.events_query()
+LISTING_SQL = """
+    SELECT * FROM {view}
+    WHERE date BETWEEN %s AND %s
+    ORDER BY date ASC, time ASC
+"""
+
+
+def hot_queries(today, trigram=False):
+    queries = []
+    for days in (0, 7, 30):
+        end = today + datetime.timedelta(days=days)
+        for view in ("v_events_clean_adults", "v_events_clean"):
+            queries.append((f"{view} {days}d", LISTING_SQL.format(view=view), (today, end)))
+    page_end = today + datetime.timedelta(days=365)
+    after = (today + datetime.timedelta(days=7), datetime.time(19, 0), 0)
+    after_untimed = (today + datetime.timedelta(days=7), None, 0)
+    for view in ("v_events_clean_adults", "v_events_clean"):
+        sql, params = event_pages.page_query(view, event_pages.LIST_FIELDS, today, page_end, after)
+        queries.append((f"{view} page", sql, tuple(params)))
+        sql, params = event_pages.page_query(view, event_pages.LIST_FIELDS, today, page_end, after_untimed)
+        queries.append((f"{view} page untimed", sql, tuple(params)))
+    for view in ("v_events_clean_adults", "v_events_clean"):
+        sql, params = event_search.search_query(view, event_pages.LIST_FIELDS, "event 4242", today, page_end, trigram=trigram)
+        queries.append((f"{view} search", sql, tuple(params)))
+    queries += [
+        ("count v_events_clean_adults", "SELECT COUNT(*) FROM v_events_clean_adults", ()),
+        ("event by id", "SELECT * FROM v_events_clean WHERE id = %s", (1,)),
+        ("event by canonical id", "SELECT id FROM events WHERE canonical_event_id = %s", ("1",)),
+    ]
+    return queries
+
+
+def seed(cur, rows):
+    # Dates from two years back to 90 days ahead, ~15% kids events, some
+    # events without a time, as the scrapers write them
+    cur.execute("""
+        INSERT INTO events (
+            title, genre, date, time, venue, city, is_kids_event,
+            canonical_event_id, source, last_seen_at, updated_at
+        )
+        SELECT
+            'Event ' || i,
+            (ARRAY['Teater', 'Kontsert', 'Ooper', 'Ballett'])[1 + i %% 4],
+            CURRENT_DATE - 730 + (i %% 820),
+            CASE WHEN i %% 10 = 0 THEN NULL ELSE make_time(12 + i %% 9, (i %% 4) * 15, 0) END,
+            'Venue ' || (i %% 200),
+            'Tallinn',
+            CASE WHEN i %% 7 = 0 THEN 1 ELSE 0 END,
+            md5(i::text),
+            'teater.ee',
+            now(),
+            now() - (i %% 1000) * interval '1 hour'
+        FROM generate_series(1, %s) AS i
+    """, (rows,))
+    cur.execute("ANALYZE events")
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+    return cur.fetchone()[0][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=ROWS_DEFAULT)
+    parser.add_argument("--schema", default=SCHEMA_DEFAULT)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    parser.add_argument("--verbose", action="store_true", help="print full plans")
+    args = parser.parse_args()
+
+    conn = db_init.get_db_connection()
+    cur = conn.cursor()
+    failures = []
+    try:
+        cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {args.schema}")
+        # public stays on the path for extensions (pg_trgm operator classes)
+        cur.execute(f"SET search_path TO {args.schema}, public")
+
+        db_init.create_tables(cur)
+        db_init.create_indexes(cur)
+        db_init.create_views(cur)
+        print(f"Seeding {args.rows} rows into {args.schema}.events...")
+        seed(cur, args.rows)
+        conn.commit()
+
+        cur.execute("SELECT to_regclass('idx_events_search_trgm') IS NOT NULL")
+        trigram = cur.fetchone()[0]
+        for name, sql, params in hot_queries(datetime.date.today(), trigram):
+            plan = explain(cur, sql, params)
+            nodes = list(plan_nodes(plan["Plan"]))
+            seq_scans = [n for n in nodes if n["Node Type"] == "Seq Scan" and n.get("Relation Name") == "events"]
+            # A sorted page would read the whole rest of the date range
+            sorts = [n for n in nodes if "Sort" in n["Node Type"]] if " page" in name else []
+            indexes = sorted({n["Index Name"] for n in nodes if "Index Name" in n})
+
+            bad = seq_scans or sorts
+            status = "FAIL" if bad else "OK"
+            if bad:
+                failures.append(name)
+            print(
+                f"{status:<5} {name:<36} {plan['Execution Time']:9.2f} ms  "
+                f"rows={plan['Plan'].get('Actual Rows', 0):<7} {', '.join(indexes) or '-'}"
+            )
+            if args.verbose or bad:
+                print(json.dumps(plan["Plan"], indent=2))
+    finally:
+        conn.rollback()
+        if not args.keep:
+            cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+            conn.commit()
+        cur.close()
+        conn.close()
+
+    if failures:
+        print(f"INDEX_CHECK_FAILED: {', '.join(failures)}")
+        sys.exit(1)
+    print("INDEX_CHECK_OK: true")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Keyword classifier for genre, kids and free events.
+
+All keyword tables are compiled into one trie-shaped regex, so a single
+scan finds every keyword occurrence, overlapping ones included.
+classify_many() joins a whole page of events into one string and scans it
+once, then maps each hit back to its event and field.
+
+Rules are the same as the old per-call `in` checks:
+- genre: first rule (in table order) with a keyword in its fields wins,
+  otherwise `default_genre`;
+- kids: any kids keyword in title, venue or description;
+- free: first free keyword (in table order) in title or description.
+
+The tables can be replaced with a JSON file named by CLASSIFIER_CONFIG,
+same shape as DEFAULT_RULES; missing keys keep their defaults.
+"""
+import os
+import re
+import json
+from bisect import bisect_right
+from collections import namedtuple
+
+FIELDS = ("title", "venue", "description")
+
+DEFAULT_RULES = {
+    "genres": [
+        {"genre": "Ooper", "keywords": ["ooper"]},
+        {"genre": "Ballett", "keywords": ["ballett", "tantsuteater", "tantsulavastus", "koreograaf"]},
+        {"genre": "Operett", "keywords": ["operett"]},
+        {"genre": "Kontsert", "keywords": ["kontsert", "jazz", "orkester", "klaveriõhtu", "kammerkontsert", "koor", "ansambel"]},
+        {"genre": "Kontsert", "keywords": ["kontserdimaja", "philly joe", "jazz", "ait"], "fields": ["venue"]},
+    ],
+    "default_genre": "Teater",
+    "genre_fields": ["title", "description"],
+    "kids": [
+        "nukuteater", "noorsooteater", "lastele", " kogupere", "mudilastele",
+        "lastelavastus", "piparkoogi", "päkapiku", "jõuluvana", "lohe",
+        "muinasjutt", "tsirkus", "kloun", "buratino", "sipsik", "lotte",
+        "pipi", "karlsson", "bullerby"
+    ],
+    "kids_fields": ["title", "venue", "description"],
+    "free": ["tasuta", "vaba sissepääs", "vabalt valitud annetusega", "annetuspõhine", "soovituslik annetus", "piletita"],
+    "free_fields": ["title", "description"],
+}
+
+# Placed between fields and events; keywords never contain \x00, so a hit
+# cannot span two fields. The spaces keep " kogupere" matching at the start
+# of a venue or description as it did with f"{title} {venue} {description}".
+SEPARATOR = " \x00 "
+# Between events: no space, a title never had one in front of it
+EVENT_SEPARATOR = "\x00"
+
+Classification = namedtuple("Classification", ["genre", "is_kids_event", "is_free", "free_reason"])
+
+
+def trie_pattern(words):
+    """
+    Regex matching any of `words`, longest first, factored by common prefix
+    ("ballett|bullerby" -> "b(?:allett|ullerby)") so re tries few branches.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # A word ending here: the longer continuation is optional (and greedy)
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+def load_rules(path=None):
+    rules = dict(DEFAULT_RULES)
+    if not path:
+        return rules
+    try:
+        with open(path, encoding="utf-8") as f:
+            rules.update(json.load(f))
+    except (OSError, ValueError) as e:
+        print(f"Classifier config {path} not loaded, using defaults: {e}")
+        return dict(DEFAULT_RULES)
+    return rules
+
+
+class Classifier:
+    def __init__(self, rules):
+        self.default_genre = rules["default_genre"]
+        # keyword -> list of (kind, rank, value, field indexes)
+        self.hits = {}
+
+        def add(keyword, kind, rank, value, fields):
+            keyword = keyword.lower()
+            field_ids = frozenset(FIELDS.index(f) for f in fields)
+            self.hits.setdefault(keyword, []).append((kind, rank, value, field_ids))
+
+        for rank, rule in enumerate(rules["genres"]):
+            for keyword in rule["keywords"]:
+                add(keyword, "genre", rank, rule["genre"], rule.get("fields", rules["genre_fields"]))
+        for keyword in rules["kids"]:
+            add(keyword, "kids", 0, 1, rules["kids_fields"])
+        for rank, keyword in enumerate(rules["free"]):
+            add(keyword, "free", rank, keyword, rules["free_fields"])
+
+        # At one position the pattern reports only the longest keyword;
+        # shorter keywords that are its prefix match there too
+        self.implied = {
+            keyword: [k for k in self.hits if k != keyword and keyword.startswith(k)]
+            for keyword in self.hits
+        }
+        # Hits are attributed to the field holding the first non-space char
+        self.lead = {keyword: len(keyword) - len(keyword.lstrip()) for keyword in self.hits}
+
+        self.pattern = re.compile(trie_pattern(self.hits))
+
+    def classify(self, title, venue, description):
+        return self.classify_many([(title, venue, description)])[0]
+
+    def classify_many(self, rows):
+        """Classify (title, venue, description) tuples with one regex scan."""
+        parts = []
+        starts = []
+        offset = 0
+        for row in rows:
+            for i, value in enumerate(row):
+                text = (value or "").lower()
+                sep = SEPARATOR if i < len(FIELDS) - 1 else EVENT_SEPARATOR
+                starts.append(offset)
+                parts.append(text + sep)
+                offset += len(text) + len(sep)
+        text = "".join(parts)
+
+        # Per event: [genre rank, genre, kids, free rank, free reason]
+        best = [[None, self.default_genre, 0, None, None] for _ in rows]
+
+        search = self.pattern.search
+        match = search(text)
+        while match:
+            found = match.group()
+            slot = bisect_right(starts, match.start() + self.lead[found]) - 1
+            event, field = divmod(slot, len(FIELDS))
+            state = best[event]
+
+            for keyword in [found] + self.implied[found]:
+                for kind, rank, value, field_ids in self.hits[keyword]:
+                    if field not in field_ids:
+                        continue
+                    if kind == "genre":
+                        if state[0] is None or rank < state[0]:
+                            state[0], state[1] = rank, value
+                    elif kind == "kids":
+                        state[2] = 1
+                    elif state[3] is None or rank < state[3]:
+                        state[3], state[4] = rank, value
+
+            # Restart one char further on, not after the hit, so keywords
+            # inside or overlapping it are found too
+            match = search(text, match.start() + 1)
+
+        return [
+            Classification(genre, kids, 1 if free_reason else 0, free_reason)
+            for _, genre, kids, _, free_reason in best
+        ]
+
+
+CLASSIFIER = Classifier(load_rules(os.getenv("CLASSIFIER_CONFIG")))
+
+
+def classify_many(rows):
+    return CLASSIFIER.classify_many(rows)
@@ -2,6 +2,9 @@ import os
 import sys
 import psycopg2
 
+import event_rules
+import scraper_base
+
 def get_db_connection():
     db_url = os.getenv("DATABASE_URL")
     if not db_url:
@@ -29,11 +32,18 @@ def ensure_views():
         conn.close()
         return {"clean": 0, "adults": 0}
 
-def run_cleanup(check_safety=False, parsed_count=0):
+def run_cleanup(check_safety=False, parsed_count=0, full=False, watermark=None):
     """
     check_safety: If True, only cleanup if we actually parsed something new 
                   (or at least connection was successful).
     parsed_count: Number of items parsed in the scraper run.
+    full: Check every row instead of only rows updated since the last run.
+    watermark: Where the next run starts, scraper_base.timestamp() taken
+               before the scrape (default: now).
+
+    The scrapers already drop non-events before writing (event_rules), so
+    this is a safety net for rows written some other way. It only looks at
+    rows with updated_at at or after the watermark kept in cleanup_state.
     """
     
     # Safety Check
@@ -45,31 +55,33 @@ def run_cleanup(check_safety=False, parsed_count=0):
     if not conn: return {"deleted": 0, "total_after": 0}
     
     cur = conn.cursor()
-    
-    # 2.2 Reegel A (Keywords)
-    cur.execute("""
-        DELETE FROM events
-        WHERE (
-            title ILIKE '%galerii%'
-            OR title ILIKE '%foto%'
-            OR title ILIKE '%pildid%'
-            OR title ILIKE '%tähistas%'
-            OR title ILIKE '%tagasivaade%'
-        )
-    """)
-    deleted_a = cur.rowcount
-    
-    # 2.2 Reegel B (No time for concerts)
+
+    cur.execute("SELECT last_updated_at FROM cleanup_state WHERE name = 'non_events' FOR UPDATE")
+    row = cur.fetchone()
+    since = None if (full or not row) else row[0]
+
+    # Watermark for the next run. Not MAX(updated_at): updated_at is stamped
+    # when a page is parsed, and a scraper thread that outlived its timeout
+    # (run_sources does not wait for it) may persist rows stamped below that
+    # maximum after this DELETE. Everything stamped since the scrape began
+    # is looked at again next time.
+    if watermark is None:
+        watermark = scraper_base.timestamp()
+
+    condition, params = event_rules.sql_condition()
+    if since is not None:
+        condition += " AND updated_at >= %s"
+        params.append(since)
+
+    cur.execute(f"DELETE FROM events WHERE {condition}", params)
+    total_deleted = cur.rowcount
+
     cur.execute("""
-        DELETE FROM events
-        WHERE source = 'concert.ee'
-        AND genre = 'Kontsert'
-        AND (time IS NULL)
-    """)
-    deleted_b = cur.rowcount
-    
+        INSERT INTO cleanup_state (name, last_updated_at) VALUES ('non_events', %s)
+        ON CONFLICT (name) DO UPDATE SET last_updated_at = excluded.last_updated_at
+    """, (watermark,))
+
     conn.commit()
-    total_deleted = deleted_a + deleted_b
     
     print(f"DELETED_RECORDS: {total_deleted}")
     
@@ -79,8 +91,8 @@ def run_cleanup(check_safety=False, parsed_count=0):
     
     cur.close()
     conn.close()
-    return {"deleted": total_deleted, "total_after": total_after}
+    return {"deleted": total_deleted, "total_after": total_after, "incremental": since is not None}
 
 if __name__ == "__main__":
-    run_cleanup()
+    run_cleanup(full="--full" in sys.argv)
     ensure_views()
@@ -1,7 +1,39 @@
 import os
 import sys
+import datetime
 import psycopg2
 
+# Bump when the view definitions change; init_db recreates views whose
+# comment does not carry the current marker (materialized views cannot be
+# replaced in place)
+VIEWS_VERSION = 4
+VIEWS_MARKER = f"kultuurivoog views v{VIEWS_VERSION}"
+
+VIEW_COLUMNS = """
+    id,
+    date,
+    time,
+    title,
+    genre,
+    venue,
+    city,
+    is_free,
+    is_kids_event,
+    description,
+    source,
+    source_url,
+    ticket_url,
+    canonical_event_id,
+    updated_at
+"""
+
+# Precomputed counts for /health, filled by refresh_views()
+STATS_QUERIES = {
+    "events_total": "SELECT COUNT(*) FROM events",
+    "events_clean": "SELECT COUNT(*) FROM v_events_clean",
+    "events_adults": "SELECT COUNT(*) FROM v_events_clean_adults",
+}
+
 def get_db_connection():
     db_url = os.getenv("DATABASE_URL")
     if not db_url:
@@ -9,78 +41,401 @@ def get_db_connection():
         sys.exit(1)
     return psycopg2.connect(db_url)
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
+def materialized_views_enabled():
+    return os.getenv("DB_MATERIALIZED_VIEWS", "0") == "1"
 
-    try:
+def relation_kind(cur, name):
+    # 'v' view, 'm' materialized view, 'r' table, 'p' partitioned table,
+    # None if missing; plus its comment. Only the current schema counts, so
+    # a scratch schema in front of public (check_indexes.py) starts empty.
+    cur.execute("""
+        SELECT c.relkind, obj_description(c.oid, 'pg_class')
+        FROM pg_class c
+        WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace
+    """, (name,))
+    row = cur.fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+def table_columns(cur, table):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+    """, (table,))
+    return {row[0] for row in cur.fetchall()}
+
+def stored_columns(cur, table):
+    # Column names in order, minus generated ones (which INSERT and COPY
+    # of a restorable dump must leave out)
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+          AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+def drop_views(cur):
+    for name in ("v_events_clean_adults", "v_events_clean"):
+        kind, _ = relation_kind(cur, name)
+        if kind == "m":
+            cur.execute(f"DROP MATERIALIZED VIEW {name} CASCADE")
+        elif kind == "v":
+            cur.execute(f"DROP VIEW {name} CASCADE")
+
+# Shared by the plain and the partitioned table
+EVENTS_COLUMNS_DDL = """
+    title TEXT NOT NULL,
+    genre TEXT,
+    date DATE NOT NULL,
+    time TIME,
+    venue TEXT,
+    city TEXT,
+    is_free INTEGER DEFAULT 0,
+    free_reason TEXT,
+    is_kids_event INTEGER DEFAULT 0,
+    description TEXT,
+    image_url TEXT,
+    ticket_url TEXT,
+    canonical_event_id TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT 'teater.ee',
+    source_url TEXT,
+    last_seen_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    content_hash TEXT,
+    title_signature BYTEA,
+    cluster_id INTEGER
+"""
+
+# Text search folds case and diacritics, so "teatr" finds "Teatr" and
+# "solo" finds "Sõlo". translate() instead of the unaccent extension keeps
+# kv_fold() IMMUTABLE (usable in the generated column and index below) and
+# needs no extension. Changing the mapping does not rewrite stored
+# search_tsv values; recreate the column if it ever does.
+FOLD_FROM = "ÕÄÖÜŠŽõäöüšžÅåÉéÈèÁáÀàÓóÚúÍíÇçÑñ"
+FOLD_TO = "OAOUSZoaouszAaEeEeAaAaOoUuIiCcNn"
+
+# Weighted for ts_rank: title A, venue and city B, description C
+SEARCH_TSV_SQL = """
+    setweight(to_tsvector('simple', kv_fold(title)), 'A') ||
+    setweight(to_tsvector('simple', kv_fold(coalesce(venue, '') || ' ' || coalesce(city, ''))), 'B') ||
+    setweight(to_tsvector('simple', kv_fold(coalesce(description, ''))), 'C')
+"""
+
+# Trigram-indexed text for partial and misspelled words (event_search.py)
+SEARCH_TRGM_SQL = "kv_fold(title || ' ' || coalesce(venue, ''))"
+
+# Columns newer than some existing tables, added by create_tables
+ADDED_EVENT_COLUMNS = [
+    # Change detection
+    ("content_hash", "TEXT"),
+    # Cross-source duplicates (event_dedup.py)
+    ("title_signature", "BYTEA"),
+    ("cluster_id", "INTEGER"),
+    # Full-text search; adding it rewrites an existing table once
+    ("search_tsv", f"tsvector GENERATED ALWAYS AS ({SEARCH_TSV_SQL}) STORED"),
+]
+
+def create_search_functions(cur):
+    cur.execute(f"""
+        CREATE OR REPLACE FUNCTION kv_fold(value TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT lower(translate(value, '{FOLD_FROM}', '{FOLD_TO}')) $$
+    """)
+
+# Monthly partitions kept ahead of the current month
+PARTITION_MONTHS_AHEAD_DEFAULT = 12
+
+def partitioning_enabled():
+    return os.getenv("DB_PARTITION_EVENTS", "0") == "1"
+
+def month_start(day):
+    return day.replace(day=1)
+
+def add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def partition_name(month):
+    return f"events_p{month:%Y_%m}"
+
+def create_partition(cur, month):
+    name = partition_name(month)
+    if relation_kind(cur, name)[0] is not None:
+        return
+    bounds = (month, add_months(month, 1))
+
+    # Rows for this month may already sit in the default partition; they
+    # have to move before the range can be attached
+    cur.execute("SELECT 1 FROM events_default WHERE date >= %s AND date < %s LIMIT 1", bounds)
+    if cur.fetchone() is None:
+        cur.execute(f"CREATE TABLE {name} PARTITION OF events FOR VALUES FROM (%s) TO (%s)", bounds)
+        return
+
+    cur.execute(f"CREATE TABLE {name} (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)")
+    cols = ", ".join(stored_columns(cur, "events"))
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM events_default WHERE date >= %s AND date < %s RETURNING *
+        )
+        INSERT INTO {name} ({cols}) SELECT {cols} FROM moved
+    """, bounds)
+    cur.execute(f"ALTER TABLE events ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+
+def ensure_partitions(cur, first_month=None):
+    ahead = int(os.getenv("DB_PARTITION_MONTHS_AHEAD", PARTITION_MONTHS_AHEAD_DEFAULT))
+    month = first_month or month_start(datetime.date.today())
+    last = add_months(month_start(datetime.date.today()), ahead)
+    while month <= last:
+        create_partition(cur, month)
+        month = add_months(month, 1)
+
+def create_partitioned_events(cur):
+    # Unique constraints on a partitioned table must contain the partition
+    # key, hence (canonical_event_id, date). canonical_event_id already
+    # hashes the date in, so this is as strict as the old UNIQUE; the name
+    # is kept so event_store can use ON CONFLICT ON CONSTRAINT on both kinds
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS events_id_seq")
+    cur.execute(f"""
+        CREATE TABLE events (
+            id INTEGER NOT NULL DEFAULT nextval('events_id_seq'),
+            {EVENTS_COLUMNS_DDL},
+            PRIMARY KEY (id, date),
+            CONSTRAINT events_canonical_event_id_key UNIQUE (canonical_event_id, date)
+        ) PARTITION BY RANGE (date)
+    """)
+    cur.execute("ALTER SEQUENCE events_id_seq OWNED BY events.id")
+    # Catches dates outside the monthly partitions so inserts never fail
+    cur.execute("CREATE TABLE events_default PARTITION OF events DEFAULT")
+
+def migrate_to_partitioned(cur):
+    print("EVENTS_PARTITIONING: migrating events to monthly partitions")
+    # Views reference the table by OID and would follow the rename
+    drop_views(cur)
+
+    cur.execute("ALTER TABLE events RENAME TO events_unpartitioned")
+    # Constraint (and index) names are schema-wide; free them for the new table
+    cur.execute("ALTER TABLE events_unpartitioned RENAME CONSTRAINT events_pkey TO events_unpartitioned_pkey")
+    cur.execute("ALTER TABLE events_unpartitioned RENAME CONSTRAINT events_canonical_event_id_key TO events_unpartitioned_canonical_key")
+    # Keep the id sequence (and so existing ids and ICS UIDs) alive
+    cur.execute("ALTER SEQUENCE events_id_seq OWNED BY NONE")
+
+    create_partitioned_events(cur)
+
+    cur.execute("SELECT MIN(date) FROM events_unpartitioned")
+    oldest = cur.fetchone()[0]
+    ensure_partitions(cur, month_start(oldest) if oldest else None)
+
+    cols = ", ".join(stored_columns(cur, "events_unpartitioned"))
+    cur.execute(f"INSERT INTO events ({cols}) SELECT {cols} FROM events_unpartitioned")
+    print(f"EVENTS_PARTITIONING: moved {cur.rowcount} rows")
+    cur.execute("DROP TABLE events_unpartitioned")
+
+def create_tables(cur, partitioned=False):
+    create_search_functions(cur)
+
+    kind = relation_kind(cur, "events")[0]
+    if partitioned and kind is None:
+        create_partitioned_events(cur)
+    elif partitioned and kind == "r":
+        migrate_to_partitioned(cur)
+    elif kind is None:
         # Create table with stricter schema
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS events (
+        cur.execute(f"""
+            CREATE TABLE events (
                 id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                genre TEXT,
-                date DATE NOT NULL,
-                time TIME,
-                venue TEXT,
-                city TEXT,
-                is_free INTEGER DEFAULT 0,
-                free_reason TEXT,
-                is_kids_event INTEGER DEFAULT 0,
-                description TEXT,
-                image_url TEXT,
-                ticket_url TEXT,
-                canonical_event_id TEXT NOT NULL UNIQUE,
-                source TEXT NOT NULL DEFAULT 'teater.ee',
-                source_url TEXT,
-                last_seen_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                {EVENTS_COLUMNS_DDL},
+                CONSTRAINT events_canonical_event_id_key UNIQUE (canonical_event_id)
             );
         """)
 
-        # Indexes
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_date ON events(date);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_is_kids ON events(is_kids_event);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_genre ON events(genre);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_canonical ON events(canonical_event_id);")
+    if relation_kind(cur, "events")[0] == "p":
+        # Turning the option off does not merge partitions back
+        ensure_partitions(cur)
 
-        print("DB_INIT_OK: true")
+    # Columns added after the table was first created. ALTER TABLE takes an
+    # ACCESS EXCLUSIVE lock even when the column exists (and waits behind
+    # open export cursors, with every read queued behind it), so only run
+    # it for columns that are really missing
+    existing = table_columns(cur, "events")
+    for name, ddl in ADDED_EVENT_COLUMNS:
+        if name not in existing:
+            cur.execute(f"ALTER TABLE events ADD COLUMN IF NOT EXISTS {name} {ddl};")
 
-        # Views
-        # 1.1 v_events_clean (Only future events)
-        cur.execute("""
-            CREATE OR REPLACE VIEW v_events_clean AS
-            SELECT
-                id,
-                date,
-                time,
-                title,
-                genre,
-                venue,
-                city,
-                is_free,
-                is_kids_event,
-                description,
-                source,
-                source_url,
-                ticket_url,
-                canonical_event_id
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS event_stats (
+            name TEXT PRIMARY KEY,
+            value BIGINT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    # Detail pages per source_url (event_details.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS detail_cache (
+            source_url TEXT PRIMARY KEY,
+            status INTEGER NOT NULL,
+            content_hash TEXT,
+            description TEXT,
+            ticket_url TEXT,
+            image_url TEXT,
+            fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+    # Watermarks of incremental maintenance jobs
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cleanup_state (
+            name TEXT PRIMARY KEY,
+            last_updated_at TIMESTAMP
+        );
+    """)
+
+def create_indexes(cur):
+    # The API reads `date BETWEEN .. ORDER BY date, time` (and /events/page
+    # adds id); (date, time, id) serves the range and the sort in one index
+    # scan
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_date_time_id ON events(date, time, id);")
+    # Same for v_events_clean_adults, the default listing
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_adult_date_time_id ON events(date, time, id) WHERE is_kids_event = 0;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_is_kids ON events(is_kids_event);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_genre ON events(genre);")
+    # Incremental cleanup scans rows by updated_at
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_updated_at ON events(updated_at);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_search ON events USING gin (search_tsv);")
+
+    # Superseded: idx_events_date and the (date, time) ones are prefixes of
+    # the (date, time, id) indexes and the UNIQUE constraint already indexes
+    # canonical_event_id
+    cur.execute("DROP INDEX IF EXISTS idx_events_date;")
+    cur.execute("DROP INDEX IF EXISTS idx_events_date_time;")
+    cur.execute("DROP INDEX IF EXISTS idx_events_adult_date_time;")
+    cur.execute("DROP INDEX IF EXISTS idx_events_canonical;")
+
+    # Trigram indexes for the title ILIKE '%...%' cleanup rules and fuzzy
+    # search. pg_trgm is optional; without it a full cleanup (--full) falls
+    # back to a seq scan and search matches whole word prefixes only.
+    cur.execute("SAVEPOINT trgm")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_events_title_trgm ON events USING gin (title gin_trgm_ops);")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_events_search_trgm ON events USING gin (({SEARCH_TRGM_SQL}) gin_trgm_ops);")
+        cur.execute("RELEASE SAVEPOINT trgm")
+    except Exception as e:
+        print(f"DB_INIT_TRGM_SKIPPED: {e}")
+        cur.execute("ROLLBACK TO SAVEPOINT trgm")
+
+def create_views(cur, materialized=False):
+    kind, comment = relation_kind(cur, "v_events_clean")
+    wanted = "m" if materialized else "v"
+    if kind is not None and (kind != wanted or comment != VIEWS_MARKER):
+        print(f"VIEWS_RECREATED: {kind} -> {wanted}")
+        drop_views(cur)
+        kind = None
+
+    if materialized:
+        if kind is not None:
+            return
+        # Snapshots of the plain views below, refreshed by refresh_views().
+        # The unique index on id is required by REFRESH ... CONCURRENTLY.
+        cur.execute(f"""
+            CREATE MATERIALIZED VIEW v_events_clean AS
+            SELECT {VIEW_COLUMNS}
             FROM events
             WHERE date >= CURRENT_DATE
+              AND (cluster_id IS NULL OR cluster_id = id)
         """)
-        
-        # 1.2 v_events_clean_adults (Future + No Kids)
         cur.execute("""
-            CREATE OR REPLACE VIEW v_events_clean_adults AS
+            CREATE MATERIALIZED VIEW v_events_clean_adults AS
             SELECT *
             FROM v_events_clean
             WHERE is_kids_event = 0
         """)
+        for name in ("v_events_clean", "v_events_clean_adults"):
+            cur.execute(f"CREATE UNIQUE INDEX {name}_id ON {name}(id);")
+            cur.execute(f"CREATE INDEX {name}_date_time_id ON {name}(date, time, id);")
+            cur.execute(f"COMMENT ON MATERIALIZED VIEW {name} IS %s", (VIEWS_MARKER,))
+        return
+
+    # 1.1 v_events_clean (Only future events, one row per duplicate cluster)
+    cur.execute(f"""
+        CREATE OR REPLACE VIEW v_events_clean AS
+        SELECT {VIEW_COLUMNS}
+        FROM events
+        WHERE date >= CURRENT_DATE
+          AND (cluster_id IS NULL OR cluster_id = id)
+    """)
+
+    # 1.2 v_events_clean_adults (Future + No Kids)
+    cur.execute("""
+        CREATE OR REPLACE VIEW v_events_clean_adults AS
+        SELECT *
+        FROM v_events_clean
+        WHERE is_kids_event = 0
+    """)
+    for name in ("v_events_clean", "v_events_clean_adults"):
+        cur.execute(f"COMMENT ON VIEW {name} IS %s", (VIEWS_MARKER,))
+
+def refresh_views():
+    """
+    Refresh materialized views (if that is how they were created) and the
+    event_stats counts. Run after every scrape.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        # v_events_clean first, the adults view is built from it
+        for name in ("v_events_clean", "v_events_clean_adults"):
+            kind, _ = relation_kind(cur, name)
+            if kind == "m":
+                cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+
+        for stat, query in STATS_QUERIES.items():
+            cur.execute(f"""
+                INSERT INTO event_stats (name, value, updated_at)
+                VALUES (%s, ({query}), CURRENT_TIMESTAMP)
+                ON CONFLICT (name) DO UPDATE SET
+                    value = excluded.value,
+                    updated_at = excluded.updated_at
+            """, (stat,))
+
+        conn.commit()
+        print("VIEWS_REFRESHED: true")
+    except Exception as e:
+        print(f"VIEWS_REFRESH_ERROR: {e}")
+        conn.rollback()
+    finally:
+        cur.close()
+        conn.close()
+
+def init_db(materialized=None, partitioned=None):
+    """
+    Create or migrate tables, indexes and views. `materialized` (default:
+    DB_MATERIALIZED_VIEWS=1) turns the two views into materialized views
+    that refresh_views() keeps current. `partitioned` (default:
+    DB_PARTITION_EVENTS=1) range-partitions events by month, migrating an
+    existing table; archive_events.py detaches and archives old months.
+    """
+    if materialized is None:
+        materialized = materialized_views_enabled()
+    if partitioned is None:
+        partitioned = partitioning_enabled()
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        create_tables(cur, partitioned)
+        create_indexes(cur)
+
+        print("DB_INIT_OK: true")
+
+        # Views
+        create_views(cur, materialized)
 
         conn.commit()
         print("VIEWS_OK: true")
-        
+
     except Exception as e:
         print(f"DB_INIT_ERROR: {e}")
         conn.rollback()
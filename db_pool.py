@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import RealDictCursor
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+# Pool sizing, overridable by env
+DB_POOL_MIN_DEFAULT = 1
+DB_POOL_MAX_DEFAULT = 10
+# Connections idle longer than this are pinged before being handed out
+DB_POOL_CHECK_INTERVAL_DEFAULT = 30
+# How long a caller waits for a free connection before giving up
+DB_POOL_TIMEOUT_DEFAULT = 10
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thin wrapper around psycopg2's ThreadedConnectionPool.
+
+    - blocks (up to `timeout` seconds) instead of raising when all connections are busy
+    - pings connections that have been idle for `check_interval` seconds and
+      replaces the ones the server (or a proxy) has dropped
+    - keeps counters for /health
+    """
+
+    def __init__(self, dsn, minconn, maxconn, check_interval, timeout, cursor_factory=None):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.check_interval = check_interval
+        self.timeout = timeout
+
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, dsn, cursor_factory=cursor_factory)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+
+        self.checkouts = 0
+        self.in_use = 0
+        self.discarded = 0
+        self.timeouts = 0
+
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _acquire(self):
+        # Stale connections are discarded and replaced; give up after maxconn attempts
+        for _ in range(self.maxconn + 1):
+            conn = self._pool.getconn()
+            if self._is_alive(conn):
+                return conn
+            with self._lock:
+                self.discarded += 1
+                self._last_used.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError("No healthy database connection available")
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No free database connection within {self.timeout}s")
+
+        try:
+            conn = self._acquire()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+
+        broken = False
+        try:
+            yield conn
+        except psycopg2.InterfaceError:
+            broken = True
+            raise
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                if broken:
+                    self.discarded += 1
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+            # putconn rolls back any open transaction before parking the connection
+            self._pool.putconn(conn, close=broken or conn.closed)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._pool._pool),
+                "checkouts": self.checkouts,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+
+def create_pool(cursor_factory=RealDictCursor):
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        raise Exception("DATABASE_URL environment variable is not set")
+
+    return ConnectionPool(
+        db_url,
+        minconn=int(os.getenv("DB_POOL_MIN", DB_POOL_MIN_DEFAULT)),
+        maxconn=int(os.getenv("DB_POOL_MAX", DB_POOL_MAX_DEFAULT)),
+        check_interval=float(os.getenv("DB_POOL_CHECK_INTERVAL", DB_POOL_CHECK_INTERVAL_DEFAULT)),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", DB_POOL_TIMEOUT_DEFAULT)),
+        cursor_factory=cursor_factory
+    )
+
+
+# Async pool for the FastAPI handlers; the sync pool above stays for the
+# refresh job, which runs in the scheduler's thread.
+DB_ASYNC_POOL_MIN_DEFAULT = 1
+DB_ASYNC_POOL_MAX_DEFAULT = 20
+
+
+def create_async_pool():
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        raise Exception("DATABASE_URL environment variable is not set")
+
+    return AsyncConnectionPool(
+        db_url,
+        min_size=int(os.getenv("DB_ASYNC_POOL_MIN", DB_ASYNC_POOL_MIN_DEFAULT)),
+        max_size=int(os.getenv("DB_ASYNC_POOL_MAX", DB_ASYNC_POOL_MAX_DEFAULT)),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", DB_POOL_TIMEOUT_DEFAULT)),
+        # Read-only handlers: autocommit keeps connections out of idle-in-transaction
+        kwargs={"row_factory": dict_row, "autocommit": True},
+        check=AsyncConnectionPool.check_connection,
+        open=False
+    )
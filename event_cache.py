@@ -0,0 +1,92 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
+# Bounded size and max age of cached event windows, overridable by env
+EVENTS_CACHE_SIZE_DEFAULT = 64
+EVENTS_CACHE_TTL_DEFAULT = 3600
+
+
+class EventCache:
+    """
+    LRU + TTL cache for query_events results keyed on (view, start, end).
+
+    Every invalidation bumps `generation`. A reader records the generation
+    before it goes to the database and hands it back to put(); results of a
+    query that raced with a refresh are dropped instead of being cached.
+    The whole cache is also dropped when the calendar date changes, because
+    the views filter on CURRENT_DATE.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._day = datetime.date.today()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_rollover(self):
+        today = datetime.date.today()
+        if today != self._day:
+            self._day = today
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self.generation += 1
+        self.invalidations += 1
+
+    def get(self, key):
+        with self._lock:
+            self._check_rollover()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation):
+        with self._lock:
+            self._check_rollover()
+            if generation != self.generation:
+                return False
+
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "generation": self.generation
+            }
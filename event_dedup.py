@@ -0,0 +1,216 @@
+"""
+Cross-source deduplication of upcoming events.
+
+canonical_event_id only merges exact matches, and teater.ee and concert.ee
+spell titles and venues differently, so a concert listed on both is
+stored twice. This pass finds such pairs and gives them a shared
+events.cluster_id; the views list only the cluster's representative.
+
+- Every event gets a MinHash signature of its folded title's character
+  trigrams, stored in events.title_signature (computed once per row).
+- Candidates are blocked by date and bucketed by LSH bands of the
+  signature, so only similar titles on the same day are ever compared:
+  near-linear in the number of events instead of all pairs.
+- A pair merges when the signatures agree on at least DEDUP_THRESHOLD of
+  their positions, the rows come from different sources and their city
+  and time do not contradict each other. A cluster holds at most one row
+  per source, so a matinee and an evening show never collapse into one.
+
+Runs after cleanup in refresh_data; can also be run by hand:
+
+    python event_dedup.py
+"""
+import os
+import re
+import struct
+import hashlib
+import itertools
+
+from psycopg2.extras import execute_values
+
+import db_init
+
+DEDUP_THRESHOLD_DEFAULT = 0.7
+
+# 32 hashes in 8 bands of 4: pairs above ~0.6 similarity share a band
+SIGNATURE_SIZE = 32
+BANDS = 8
+ROWS_PER_BAND = SIGNATURE_SIZE // BANDS
+SHINGLE_SIZE = 3
+
+# One 64-byte blake2b digest per shingle gives all 32 hash functions as
+# 16-bit slices; stored signatures stay comparable across runs
+SIGNATURE_FORMAT = f">{SIGNATURE_SIZE}H"
+
+# Same folding as kv_fold() in the database
+FOLD_TABLE = str.maketrans(db_init.FOLD_FROM, db_init.FOLD_TO)
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+UPDATE_PAGE_SIZE = 500
+
+
+def normalize_title(title):
+    return NON_WORD_RE.sub(" ", (title or "").translate(FOLD_TABLE).lower()).strip()
+
+
+def shingles(text):
+    padded = f" {text} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded}
+    return {padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def title_signature(title):
+    """MinHash signature of the title, packed as SIGNATURE_SIZE uint16 values."""
+    hashes = [
+        struct.unpack(SIGNATURE_FORMAT, hashlib.blake2b(s.encode("utf-8"), digest_size=64).digest())
+        for s in shingles(normalize_title(title))
+    ]
+    return struct.pack(SIGNATURE_FORMAT, *map(min, zip(*hashes)))
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the two titles' trigram sets."""
+    a = struct.unpack(SIGNATURE_FORMAT, sig_a)
+    b = struct.unpack(SIGNATURE_FORMAT, sig_b)
+    return sum(1 for x, y in zip(a, b) if x == y) / SIGNATURE_SIZE
+
+
+def compatible(a, b):
+    if a["source"] == b["source"]:
+        return False
+    if a["city"] and b["city"] and a["city"].strip().lower() != b["city"].strip().lower():
+        return False
+    if a["time"] is not None and b["time"] is not None and a["time"] != b["time"]:
+        return False
+    return True
+
+
+def representative(members):
+    # The most complete listing (with a time, then with a venue) stands for
+    # the cluster; lowest id breaks ties so the choice is stable
+    return min(members, key=lambda ev: (ev["time"] is None, not ev["venue"], ev["id"]))
+
+
+def cluster_block(events, threshold):
+    """
+    events: rows of one date. Returns {id: cluster_id} for rows that belong
+    to a cluster of two or more.
+    """
+    buckets = {}
+    for index, ev in enumerate(events):
+        sig = ev["title_signature"]
+        for band in range(BANDS):
+            key = (band, sig[band * ROWS_PER_BAND * 2:(band + 1) * ROWS_PER_BAND * 2])
+            buckets.setdefault(key, []).append(index)
+
+    pairs = {}
+    for members in buckets.values():
+        for i, j in itertools.combinations(members, 2):
+            if (i, j) in pairs or not compatible(events[i], events[j]):
+                continue
+            score = similarity(events[i]["title_signature"], events[j]["title_signature"])
+            if score >= threshold:
+                pairs[(i, j)] = score
+
+    # Union the best matches first; a merge that would put two rows of the
+    # same source into one cluster is refused
+    parent = list(range(len(events)))
+    sources = [{ev["source"]} for ev in events]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for (i, j), _ in sorted(pairs.items(), key=lambda item: -item[1]):
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j or sources[root_i] & sources[root_j]:
+            continue
+        parent[root_j] = root_i
+        sources[root_i] |= sources[root_j]
+
+    clusters = {}
+    for index in range(len(events)):
+        clusters.setdefault(find(index), []).append(events[index])
+
+    assigned = {}
+    for members in clusters.values():
+        if len(members) > 1:
+            rep_id = representative(members)["id"]
+            for ev in members:
+                assigned[ev["id"]] = rep_id
+    return assigned
+
+
+def fill_signatures(cur):
+    # Titles only change in case and spacing for a given canonical_event_id,
+    # which normalize_title() ignores, so a signature is computed once
+    cur.execute("""
+        SELECT id, date, title FROM events
+        WHERE date >= CURRENT_DATE AND title_signature IS NULL
+    """)
+    rows = [(event_id, day, title_signature(title)) for event_id, day, title in cur.fetchall()]
+    if rows:
+        execute_values(cur, """
+            UPDATE events SET title_signature = v.sig
+            FROM (VALUES %s) AS v (id, date, sig)
+            WHERE events.id = v.id AND events.date = v.date
+        """, rows, page_size=UPDATE_PAGE_SIZE)
+    return len(rows)
+
+
+def run_dedup(threshold=None):
+    threshold = threshold if threshold is not None else float(
+        os.getenv("DEDUP_THRESHOLD", DEDUP_THRESHOLD_DEFAULT)
+    )
+
+    conn = db_init.get_db_connection()
+    cur = conn.cursor()
+    try:
+        signed = fill_signatures(cur)
+
+        # Past events keep whatever cluster they had
+        cur.execute("""
+            SELECT id, date, time, venue, city, source, title_signature, cluster_id
+            FROM events
+            WHERE date >= CURRENT_DATE
+            ORDER BY date
+        """)
+        columns = [col.name for col in cur.description]
+        rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        for row in rows:
+            row["title_signature"] = bytes(row["title_signature"])
+
+        assigned = {}
+        for _, block in itertools.groupby(rows, key=lambda row: row["date"]):
+            assigned.update(cluster_block(list(block), threshold))
+
+        changes = [
+            (row["id"], row["date"], assigned.get(row["id"]))
+            for row in rows if row["cluster_id"] != assigned.get(row["id"])
+        ]
+        if changes:
+            execute_values(cur, """
+                UPDATE events SET cluster_id = v.cluster_id
+                FROM (VALUES %s) AS v (id, date, cluster_id)
+                WHERE events.id = v.id AND events.date = v.date
+            """, changes, template="(%s, %s, %s::integer)", page_size=UPDATE_PAGE_SIZE)
+        conn.commit()
+    except Exception as e:
+        print(f"DEDUP_ERROR: {e}")
+        conn.rollback()
+        return {"error": str(e)}
+    finally:
+        cur.close()
+        conn.close()
+
+    hidden = sum(1 for event_id, rep_id in assigned.items() if event_id != rep_id)
+    print(f"DEDUP_SIGNATURES: {signed}")
+    print(f"DEDUP_HIDDEN: {hidden}")
+    return {"signed": signed, "clustered": len(assigned), "hidden": hidden, "changed": len(changes)}
+
+
+if __name__ == "__main__":
+    run_dedup()
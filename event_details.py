@@ -0,0 +1,175 @@
+"""
+Detail-page enrichment: description, ticket link and image per event.
+
+The listings only carry title, date and venue. For every source_url on a
+page this looks in detail_cache first; URLs that are missing or older
+than DETAIL_TTL_HOURS are fetched concurrently (per-host limits through
+scraper_base.polite_get), at most DETAIL_MAX_FETCHES per source run, so
+the first runs fill the cache gradually and later runs fetch next to
+nothing. A re-fetched page whose body hash is unchanged is not parsed
+again. A page that is gone (404, 410) is cached with empty fields so a
+dead link is not retried every hour. Any other failure (a block, a server
+error, the network) leaves the cache row as it was, old fields and
+fetched_at included, so the URL is retried on the next run.
+"""
+import os
+import hashlib
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+from psycopg2.extras import execute_values
+
+DETAIL_TTL_HOURS_DEFAULT = 168
+DETAIL_CONCURRENCY_DEFAULT = 4
+DETAIL_MAX_FETCHES_DEFAULT = 200
+
+DESCRIPTION_MAX_LENGTH = 2000
+
+# Links to these hosts are ticket links, whatever their text says
+TICKET_HOSTS = ("piletilevi.ee", "fienta.com", "ticketer.ee", "piletikeskus.ee", "tickets.ee")
+TICKET_TEXTS = ("osta pilet", "piletid", "buy ticket", "tickets")
+
+DETAIL_FIELDS = ("description", "ticket_url", "image_url")
+
+# The only errors worth remembering; 403/429/5xx are usually a block or an
+# outage and must not overwrite good cached details
+GONE_STATUSES = (404, 410)
+
+
+def body_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def meta_content(doc, *selectors):
+    for css in selectors:
+        el = doc.select_one(css)
+        value = el.attr("content") if el else None
+        if value and value.strip():
+            return value.strip()
+    return ""
+
+
+def find_ticket_url(doc, base_url):
+    for link in doc.select("a[href]"):
+        href = (link.attr("href") or "").strip()
+        if not href or href.startswith(("#", "mailto:", "javascript:")):
+            continue
+        url = urljoin(base_url, href)
+        host = urlsplit(url).netloc.lower()
+        if any(host == h or host.endswith("." + h) for h in TICKET_HOSTS):
+            return url
+        if any(t in link.text().lower() for t in TICKET_TEXTS):
+            return url
+    return ""
+
+
+def extract_details(doc, url):
+    """Generic extraction from Open Graph / meta tags and ticket links."""
+    description = meta_content(doc, 'meta[property="og:description"]', 'meta[name="description"]')
+    image_url = meta_content(doc, 'meta[property="og:image"]')
+    return {
+        "description": description[:DESCRIPTION_MAX_LENGTH],
+        "ticket_url": find_ticket_url(doc, url),
+        "image_url": urljoin(url, image_url) if image_url else "",
+    }
+
+
+def load_cached(cur, urls, ttl_hours):
+    cur.execute("""
+        SELECT source_url, status, content_hash, description, ticket_url, image_url,
+               fetched_at > (CURRENT_TIMESTAMP AT TIME ZONE 'UTC') - %s * interval '1 hour' AS fresh
+        FROM detail_cache
+        WHERE source_url = ANY(%s)
+    """, (ttl_hours, list(urls)))
+    columns = [col.name for col in cur.description]
+    return {row[0]: dict(zip(columns, row)) for row in cur.fetchall()}
+
+
+def store(cur, entries):
+    execute_values(cur, """
+        INSERT INTO detail_cache (source_url, status, content_hash, description, ticket_url, image_url, fetched_at)
+        VALUES %s
+        ON CONFLICT (source_url) DO UPDATE SET
+            status = excluded.status,
+            content_hash = excluded.content_hash,
+            description = excluded.description,
+            ticket_url = excluded.ticket_url,
+            image_url = excluded.image_url,
+            fetched_at = excluded.fetched_at
+    """, [
+        (e["source_url"], e["status"], e["content_hash"], e["description"],
+         e["ticket_url"], e["image_url"], e["fetched_at"])
+        for e in entries
+    ])
+
+
+def fetch_entry(source, url, cached):
+    """Fetch and extract one detail page; None if it could not be read."""
+    try:
+        status, text = source.fetch_detail(url)
+    except Exception as e:
+        print(f"Detail fetch failed {url}: {e}")
+        return None
+
+    if status != 200 and status not in GONE_STATUSES:
+        print(f"Detail fetch failed {url}: HTTP {status}")
+        return None
+
+    # Naive UTC like the events timestamps (scraper_base.timestamp)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    entry = {"source_url": url, "status": status, "fetched_at": now}
+    if status != 200:
+        entry.update(content_hash=None, description="", ticket_url="", image_url="")
+        return entry
+
+    entry["content_hash"] = body_hash(text)
+    if cached and cached["content_hash"] == entry["content_hash"]:
+        entry.update({f: cached[f] for f in DETAIL_FIELDS})
+    else:
+        entry.update(source.extract_details(source.build_document(text), url))
+    return entry
+
+
+def enrich_details(conn, source, events, max_fetches):
+    """
+    Fill description, ticket_url and (if empty) image_url of `events` from
+    their detail pages. Commits the cache lookup before fetching, so no
+    transaction stays open across the network calls; the new cache rows are
+    written in the caller's transaction. Returns {"cached": n, "fetched": n}.
+    """
+    urls = {ev["source_url"] for ev in events if ev.get("source_url")}
+    if not urls:
+        return {"cached": 0, "fetched": 0}
+
+    ttl_hours = float(os.getenv("DETAIL_TTL_HOURS", DETAIL_TTL_HOURS_DEFAULT))
+    concurrency = int(os.getenv("DETAIL_CONCURRENCY", DETAIL_CONCURRENCY_DEFAULT))
+
+    with conn.cursor() as cur:
+        cached = load_cached(cur, urls, ttl_hours)
+    conn.commit()
+
+    fresh = {url for url in urls if url in cached and cached[url]["fresh"]}
+    # Over budget: the rest keep their stale (or no) details until a later run
+    stale = sorted(urls - fresh)[:max(0, max_fetches)]
+    fetched = []
+    if stale:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="detail") as pool:
+            results = pool.map(lambda url: fetch_entry(source, url, cached.get(url)), stale)
+            fetched = [entry for entry in results if entry is not None]
+        if fetched:
+            with conn.cursor() as cur:
+                store(cur, fetched)
+
+    details = dict(cached)
+    details.update((entry["source_url"], entry) for entry in fetched)
+    for ev in events:
+        found = details.get(ev.get("source_url"))
+        if not found:
+            continue
+        ev["description"] = found["description"] or ev["description"]
+        ev["ticket_url"] = found["ticket_url"] or ev["ticket_url"]
+        # The listing's own thumbnail wins
+        ev["image_url"] = ev["image_url"] or found["image_url"]
+
+    return {"cached": len(fresh), "fetched": len(fetched)}
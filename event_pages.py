@@ -0,0 +1,89 @@
+"""
+Keyset pagination for the events listing.
+
+Pages are ordered by (date, time, id) with events without a time last in
+their day, the same order as /events/<window>. The cursor is the sort key
+of the last row on a page, base64-encoded. The ORDER BY matches the
+(date, time, id) indexes, so the next page is read in index order from the
+cursor's date on and stops after `limit` rows, no matter how deep the
+client pages.
+"""
+import base64
+import datetime
+
+import orjson
+
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX = 500
+
+# Columns of v_events_clean a client may ask for with fields=
+FIELDS = (
+    "id", "date", "time", "title", "genre", "venue", "city", "is_free",
+    "is_kids_event", "description", "source", "source_url", "ticket_url",
+    "canonical_event_id", "updated_at"
+)
+
+# What the list view in static/index.html renders (no description)
+LIST_FIELDS = ("id", "date", "time", "title", "genre", "venue", "city", "is_free")
+
+# Needed to build the next cursor, selected even when not requested
+KEY_FIELDS = ("date", "time", "id")
+
+# Plain columns, so idx_events_date_time_id can return rows in this order
+SORT_KEY_SQL = "date, time NULLS LAST, id"
+
+
+def parse_fields(value):
+    """Comma-separated field list -> tuple; ValueError on unknown names."""
+    if not value:
+        return LIST_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or value}")
+    return fields
+
+
+def encode_cursor(row):
+    key = [row["date"].isoformat(), row["time"].isoformat() if row["time"] else None, row["id"]]
+    return base64.urlsafe_b64encode(orjson.dumps(key)).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Cursor string -> (date, time or None, id); ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        day, time_str, event_id = orjson.loads(base64.urlsafe_b64decode(padded))
+        time_value = datetime.time.fromisoformat(time_str) if time_str is not None else None
+        return datetime.date.fromisoformat(day), time_value, int(event_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def page_query(view, fields, start_date, end_date, cursor=None, limit=PAGE_LIMIT_DEFAULT):
+    """
+    SQL and params for one page. Selects limit + 1 rows; the extra row only
+    tells whether a next page exists.
+    """
+    columns = ", ".join(dict.fromkeys(fields + KEY_FIELDS))
+    where = "date BETWEEN %s AND %s"
+    params = [start_date, end_date]
+    if cursor is not None:
+        day, time_value, event_id = cursor
+        # Rows after the cursor in SORT_KEY_SQL order. A row comparison
+        # cannot express NULLS LAST, hence the spelled-out OR; the plain
+        # `date >= %s` is what bounds the index scan
+        if time_value is None:
+            after = "date > %s OR (date = %s AND time IS NULL AND id > %s)"
+            params += [day, day, day, event_id]
+        else:
+            after = "date > %s OR (date = %s AND (time > %s OR time IS NULL OR (time = %s AND id > %s)))"
+            params += [day, day, day, time_value, time_value, event_id]
+        where += f" AND date >= %s AND ({after})"
+    sql = f"""
+        SELECT {columns} FROM {view}
+        WHERE {where}
+        ORDER BY {SORT_KEY_SQL}
+        LIMIT %s
+    """
+    return sql, params + [limit + 1]
@@ -0,0 +1,105 @@
+"""
+Rules for listings that are not real events (photo galleries, recaps,
+concert.ee news teasers, which have a date but no start time).
+
+Each rule can test a parsed event dict in Python, which the scrapers do
+before persisting, and render itself as an SQL condition for the
+incremental pass in cleanup_non_events.py, so both paths share one list.
+"""
+import re
+
+NON_EVENT_TITLE_KEYWORDS = ["galerii", "foto", "pildid", "tähistas", "tagasivaade"]
+
+# concert.ee pages of actual concerts; news and galleries live elsewhere
+CONCERT_PAGE_URL = r"^https://concert\.ee/kontsert/"
+
+
+class TitleKeywordRule:
+    """Title contains any of the keywords, case-insensitive (ILIKE '%kw%')."""
+
+    def __init__(self, name, keywords):
+        self.name = name
+        self.keywords = [k.lower() for k in keywords]
+
+    def matches(self, event):
+        title = (event.get("title") or "").lower()
+        return any(k in title for k in self.keywords)
+
+    def sql(self):
+        # One ILIKE per keyword rather than ILIKE ANY(...): GIN trigram
+        # indexes can serve each branch of an OR, not an array comparison
+        clauses = " OR ".join("title ILIKE %s" for _ in self.keywords)
+        return f"({clauses})", [f"%{k}%" for k in self.keywords]
+
+
+class MissingTimeRule:
+    """
+    Events of a source and genre that were listed without a start time.
+
+    With `event_url` (a regex valid in both Python and PostgreSQL), an
+    event whose source_url matches it is a real event page and is kept even
+    without a time.
+    """
+
+    def __init__(self, name, source, genre, event_url=None):
+        self.name = name
+        self.source = source
+        self.genre = genre
+        self.event_url = event_url
+        self._event_url_re = re.compile(event_url) if event_url else None
+
+    def matches(self, event):
+        return (
+            event.get("source") == self.source
+            and event.get("genre") == self.genre
+            and not event.get("time")
+            and not (self._event_url_re and self._event_url_re.search(event.get("source_url") or ""))
+        )
+
+    def sql(self):
+        if not self.event_url:
+            return "(source = %s AND genre = %s AND time IS NULL)", [self.source, self.genre]
+        return (
+            "(source = %s AND genre = %s AND time IS NULL AND COALESCE(source_url, '') !~ %s)",
+            [self.source, self.genre, self.event_url]
+        )
+
+
+RULES = [
+    # 2.2 Reegel A (Keywords)
+    TitleKeywordRule("title_keyword", NON_EVENT_TITLE_KEYWORDS),
+    # 2.2 Reegel B (No time for concerts; news and galleries never have one)
+    MissingTimeRule("concert_without_time", "concert.ee", "Kontsert", event_url=CONCERT_PAGE_URL),
+]
+
+
+def non_event_rule(event, rules=RULES):
+    """Return the name of the first rule the event breaks, or None."""
+    for rule in rules:
+        if rule.matches(event):
+            return rule.name
+    return None
+
+
+def filter_events(events, rules=RULES):
+    """Split enriched events into (kept, {rule name: dropped count})."""
+    kept = []
+    dropped = {}
+    for event in events:
+        rule = non_event_rule(event, rules)
+        if rule is None:
+            kept.append(event)
+        else:
+            dropped[rule] = dropped.get(rule, 0) + 1
+    return kept, dropped
+
+
+def sql_condition(rules=RULES):
+    """WHERE fragment matching any rule, with its parameters."""
+    parts = []
+    params = []
+    for rule in rules:
+        clause, rule_params = rule.sql()
+        parts.append(clause)
+        params.extend(rule_params)
+    return "(" + " OR ".join(parts) + ")", params
@@ -0,0 +1,62 @@
+"""
+Text search over event titles, venues and descriptions.
+
+Matches the generated events.search_tsv column (GIN index, db_init) with
+every query word as a prefix, and, when pg_trgm is installed, also titles
+and venues that are merely similar to the query (typos, partial words)
+through idx_events_search_trgm. Both sides are folded with kv_fold(), so
+"solo" finds "Sõlo". Results are ranked, best first, and combine with the
+usual date range and show_kids view.
+"""
+import re
+
+import db_init
+
+SEARCH_LIMIT_DEFAULT = 20
+SEARCH_LIMIT_MAX = 100
+SEARCH_MAX_WORDS = 8
+
+WORD_RE = re.compile(r"\w+")
+
+
+def tsquery_text(text):
+    """'jazz Estonia' -> 'jazz:* & estonia:*'; None if there are no words."""
+    words = WORD_RE.findall(text.lower())[:SEARCH_MAX_WORDS]
+    if not words:
+        return None
+    # \w never matches tsquery operators, so the words need no quoting
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def search_query(view, fields, text, start_date, end_date, limit=SEARCH_LIMIT_DEFAULT, trigram=False):
+    """
+    SQL and params for the best `limit` matches of `text`. Matching runs on
+    events, where the indexes are; the view then decides which of the
+    matches are listed (future, kids filter).
+    """
+    query = tsquery_text(text)
+    match = "search_tsv @@ to_tsquery('simple', kv_fold(%s))"
+    rank = "ts_rank_cd(search_tsv, to_tsquery('simple', kv_fold(%s)))"
+    match_params = [query]
+    rank_params = [query]
+    if trigram:
+        # %> is word similarity: the query against the closest part of the
+        # text, so one misspelled word still matches a long title
+        match = f"({match} OR {db_init.SEARCH_TRGM_SQL} %%> kv_fold(%s))"
+        rank += f" + word_similarity(kv_fold(%s), {db_init.SEARCH_TRGM_SQL})"
+        match_params.append(text)
+        rank_params.append(text)
+
+    columns = ", ".join(f"v.{f}" for f in fields)
+    sql = f"""
+        SELECT {columns}, m.rank
+        FROM (
+            SELECT id, date, {rank} AS rank
+            FROM events
+            WHERE date BETWEEN %s AND %s AND {match}
+        ) m
+        JOIN {view} v ON v.id = m.id AND v.date = m.date
+        ORDER BY m.rank DESC, v.date, v.time, v.id
+        LIMIT %s
+    """
+    return sql, rank_params + [start_date, end_date] + match_params + [limit]
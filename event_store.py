@@ -0,0 +1,109 @@
+import hashlib
+
+from psycopg2.extras import execute_values
+
+# Columns written by the scrapers, in table order
+EVENT_COLUMNS = [
+    "title", "genre", "date", "time", "venue", "city",
+    "is_free", "free_reason", "is_kids_event", "description", "image_url", "ticket_url",
+    "canonical_event_id", "source", "source_url",
+    "last_seen_at", "created_at", "updated_at", "content_hash"
+]
+
+# Bookkeeping columns that never count as a content change
+NON_CONTENT_COLUMNS = {"last_seen_at", "created_at", "updated_at", "content_hash"}
+
+# Rows per VALUES statement when filling the staging table
+STAGING_PAGE_SIZE = 500
+
+
+def content_hash(event, columns):
+    values = ["" if event[col] is None else str(event[col]) for col in columns]
+    return hashlib.sha1("\x1f".join(values).encode("utf-8")).hexdigest()
+
+
+def upsert_events(conn, events, update_columns):
+    """
+    Bulk UPSERT of parsed events.
+
+    Rows are loaded into a temp staging table with execute_values and merged
+    into `events` with a single INSERT ... ON CONFLICT, so a run costs a
+    handful of round trips instead of one per event. `update_columns` are the
+    columns overwritten when canonical_event_id already exists.
+
+    Each event carries a content_hash of its update_columns. A row whose hash
+    is unchanged only gets last_seen_at bumped; updated_at and the other
+    columns are rewritten only when the content really changed.
+
+    Returns {"inserted": n, "updated": n, "unchanged": n}. The caller owns
+    the transaction.
+    """
+    if not events:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    hashed_columns = [col for col in update_columns if col not in NON_CONTENT_COLUMNS]
+    for ev in events:
+        ev["content_hash"] = content_hash(ev, hashed_columns)
+
+    cols = ", ".join(EVENT_COLUMNS)
+    updates = ",\n".join(f"{col}=excluded.{col}" for col in update_columns + ["content_hash"])
+
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS events_staging
+            ON COMMIT DELETE ROWS
+            AS SELECT {cols} FROM events WITH NO DATA
+        """)
+        cur.execute("TRUNCATE events_staging")
+
+        execute_values(
+            cur,
+            f"INSERT INTO events_staging ({cols}) VALUES %s",
+            [tuple(ev[col] for col in EVENT_COLUMNS) for ev in events],
+            page_size=STAGING_PAGE_SIZE
+        )
+
+        # A page can list the same event twice. Keep one row per
+        # canonical_event_id before either statement below reads the staging
+        # table: the newest last_seen_at, then the one staged last (ctid
+        # follows insert order in the freshly truncated table), as the last
+        # write would have won row by row. Without this ON CONFLICT DO UPDATE
+        # fails with "cannot affect row a second time", and the unchanged
+        # check could pass on one copy while the other is written.
+        cur.execute("""
+            DELETE FROM events_staging
+            WHERE ctid NOT IN (
+                SELECT DISTINCT ON (canonical_event_id) ctid
+                FROM events_staging
+                ORDER BY canonical_event_id, last_seen_at DESC, ctid DESC
+            )
+        """)
+
+        # Unchanged rows: only last_seen_at moves (last_seen_at is not
+        # indexed, so this stays a HOT update)
+        cur.execute("""
+            UPDATE events SET last_seen_at = s.last_seen_at
+            FROM events_staging s
+            WHERE events.canonical_event_id = s.canonical_event_id
+              AND events.date = s.date
+              AND events.content_hash = s.content_hash
+        """)
+        unchanged = cur.rowcount
+
+        # The constraint is UNIQUE (canonical_event_id), or (canonical_event_id,
+        # date) on a partitioned table (see db_init). The WHERE skips the rows
+        # handled above; they return nothing. enrich() stamps created_at and
+        # updated_at identically and an update keeps the stored created_at,
+        # which tells inserts apart (xmax = 0 is not allowed on partitions).
+        cur.execute(f"""
+            INSERT INTO events ({cols})
+            SELECT {cols} FROM events_staging
+            ON CONFLICT ON CONSTRAINT events_canonical_event_id_key DO UPDATE SET
+                {updates}
+            WHERE events.content_hash IS DISTINCT FROM excluded.content_hash
+            RETURNING (created_at = updated_at) AS inserted
+        """)
+        results = cur.fetchall()
+
+    inserted = sum(1 for (is_inserted,) in results if is_inserted)
+    return {"inserted": inserted, "updated": len(results) - inserted, "unchanged": unchanged}
@@ -0,0 +1,142 @@
+"""
+Pluggable HTML parse engines for the scrapers.
+
+Sources only use the small node API below, so the same extraction code runs
+on BeautifulSoup (default, pure Python), lxml or selectolax:
+
+    node.select(css)       -> list of nodes
+    node.select_one(css)   -> node or None
+    node.text()            -> stripped text of the subtree
+    node.attr(name)        -> attribute value or None
+
+The engine is picked with SCRAPER_PARSER=bs4|lxml|selectolax. lxml (with
+cssselect) and selectolax are optional; if the requested one is not
+installed, parsing falls back to bs4 with a warning.
+"""
+import os
+
+from bs4 import BeautifulSoup
+
+PARSER_DEFAULT = "bs4"
+
+
+class Bs4Node:
+    __slots__ = ("el",)
+
+    def __init__(self, el):
+        self.el = el
+
+    def select(self, css):
+        return [Bs4Node(el) for el in self.el.select(css)]
+
+    def select_one(self, css):
+        el = self.el.select_one(css)
+        return Bs4Node(el) if el is not None else None
+
+    def text(self):
+        return self.el.get_text(strip=True)
+
+    def attr(self, name):
+        value = self.el.get(name)
+        # bs4 returns multi-valued attributes (class, rel) as lists
+        return " ".join(value) if isinstance(value, list) else value
+
+
+class LxmlNode:
+    __slots__ = ("el",)
+
+    # Compiled CSSSelector per selector string, shared by all nodes
+    _selectors = {}
+
+    def __init__(self, el):
+        self.el = el
+
+    @classmethod
+    def _compile(cls, css):
+        selector = cls._selectors.get(css)
+        if selector is None:
+            from lxml.cssselect import CSSSelector
+            selector = cls._selectors[css] = CSSSelector(css)
+        return selector
+
+    def select(self, css):
+        return [LxmlNode(el) for el in self._compile(css)(self.el)]
+
+    def select_one(self, css):
+        found = self._compile(css)(self.el)
+        return LxmlNode(found[0]) if found else None
+
+    def text(self):
+        # Same as bs4 get_text(strip=True): strip every text node, join with ""
+        return "".join(s.strip() for s in self.el.itertext() if s.strip())
+
+    def attr(self, name):
+        return self.el.get(name)
+
+
+class SelectolaxNode:
+    __slots__ = ("el",)
+
+    def __init__(self, el):
+        self.el = el
+
+    def select(self, css):
+        return [SelectolaxNode(el) for el in self.el.css(css)]
+
+    def select_one(self, css):
+        el = self.el.css_first(css)
+        return SelectolaxNode(el) if el is not None else None
+
+    def text(self):
+        return self.el.text(deep=True, separator="", strip=True)
+
+    def attr(self, name):
+        return self.el.attributes.get(name)
+
+
+def parse_bs4(html):
+    return Bs4Node(BeautifulSoup(html, 'html.parser'))
+
+
+def parse_lxml(html):
+    import lxml.html
+    import lxml.cssselect  # noqa: F401 - fail here, not on the first select()
+    return LxmlNode(lxml.html.document_fromstring(html))
+
+
+def parse_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+    return SelectolaxNode(LexborHTMLParser(html))
+
+
+ENGINES = {
+    "bs4": parse_bs4,
+    "lxml": parse_lxml,
+    "selectolax": parse_selectolax,
+}
+
+
+def available_engines():
+    names = []
+    for name, parse in ENGINES.items():
+        try:
+            parse("<p></p>")
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def resolve_engine(name=None):
+    name = name or os.getenv("SCRAPER_PARSER", PARSER_DEFAULT)
+    if name not in ENGINES:
+        print(f"Unknown SCRAPER_PARSER '{name}', using {PARSER_DEFAULT}")
+        return PARSER_DEFAULT
+    if name not in available_engines():
+        print(f"SCRAPER_PARSER '{name}' is not installed, using {PARSER_DEFAULT}")
+        return PARSER_DEFAULT
+    return name
+
+
+def parse_document(html, engine=PARSER_DEFAULT):
+    return ENGINES[engine](html)
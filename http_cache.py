@@ -0,0 +1,103 @@
+import os
+import gzip
+import json
+import hashlib
+from collections import namedtuple
+
+HTTP_CACHE_DIR_DEFAULT = ".cache/http"
+
+# url: as requested; text: body (replayed from disk on 304);
+# unchanged: body hash matches the last successfully processed copy;
+# entry: metadata to write with commit() once the page has been persisted
+Page = namedtuple("Page", ["url", "text", "status", "unchanged", "entry"])
+
+
+def body_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class HttpCache:
+    """
+    On-disk validator cache for scraper fetches.
+
+    For every URL it keeps ETag, Last-Modified, the SHA1 of the body and a
+    gzipped copy of the body. Requests are sent with If-None-Match /
+    If-Modified-Since; a 304 or a body with an unchanged hash is reported as
+    `unchanged` so the caller can skip parsing and DB writes. Validators are
+    only written by commit(), after the page was persisted, so a failed run
+    is retried in full next time.
+    """
+
+    def __init__(self, directory, enabled=True):
+        self.directory = directory
+        self.enabled = enabled
+
+    def _path(self, url, suffix):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def load(self, url):
+        if not self.enabled:
+            return None
+        try:
+            with open(self._path(url, ".json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cached_body(self, url):
+        try:
+            with gzip.open(self._path(url, ".html.gz"), "rt", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get(self, get, url, headers=None, **kwargs):
+        """
+        Fetch `url` through `get` (session.get or polite_get) and return
+        (response, Page). Conditional headers are only sent when a cached
+        body exists, so a 304 can always be answered from disk.
+        """
+        entry = self.load(url)
+        cached_body = self.cached_body(url) if entry else None
+        request_headers = dict(headers or {})
+        if cached_body is not None:
+            request_headers.update(self.conditional_headers(entry))
+
+        response = get(url, headers=request_headers, **kwargs)
+
+        if response.status_code == 304 and cached_body is not None:
+            return response, Page(url, cached_body, 304, True, None)
+
+        text = response.text
+        new_entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "body_hash": body_hash(text)
+        }
+        unchanged = bool(entry) and entry.get("body_hash") == new_entry["body_hash"]
+        return response, Page(url, text, response.status_code, unchanged, new_entry)
+
+    def commit(self, page):
+        if not self.enabled or page.entry is None or page.status != 200:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        body_path = self._path(page.url, ".html.gz")
+        with gzip.open(body_path + ".tmp", "wt", encoding="utf-8") as f:
+            f.write(page.text)
+        os.replace(body_path + ".tmp", body_path)
+
+        meta_path = self._path(page.url, ".json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(page.entry, f)
+        os.replace(meta_path + ".tmp", meta_path)
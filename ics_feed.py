@@ -0,0 +1,197 @@
+"""
+iCalendar output: the single-event .ics and the subscribable feed.
+
+A feed is the VCALENDAR of one window (snapshots.WINDOWS), optionally
+narrowed to a genre and/or city. Feeds are built from the same rows as the
+JSON windows, stored gzip-compressed and dropped on every refresh, so a
+calendar app polling every few minutes is answered from memory, usually
+with a 304.
+"""
+import gzip
+import zlib
+import hashlib
+import datetime
+import threading
+from collections import OrderedDict, namedtuple
+
+ICS_FEED_CACHE_SIZE_DEFAULT = 64
+ICS_FEED_MAX_AGE_DEFAULT = 300
+
+PRODID = "-//AG Kultuurivoog//ET"
+UID_DOMAIN = "ag-kultuurivoog"
+
+# Events without a time are put at 19:00, the usual curtain time
+DEFAULT_TIME = "190000"
+
+# Lines longer than this many octets are folded (RFC 5545 3.1)
+LINE_OCTETS = 75
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+Feed = namedtuple("Feed", ["gz_body", "etag", "last_modified", "day", "count", "size"])
+
+
+def ics_escape(text):
+    if not text: return ""
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def fold_line(line):
+    data = line.encode("utf-8")
+    if len(data) <= LINE_OCTETS:
+        return line
+    parts = []
+    limit = LINE_OCTETS
+    while data:
+        cut = min(limit, len(data))
+        # Never split a UTF-8 sequence
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+        limit = LINE_OCTETS - 1  # continuation lines start with a space
+    return "\r\n ".join(parts)
+
+
+def event_uid(event):
+    return f"{event['canonical_event_id']}@{UID_DOMAIN}"
+
+
+def vevent_lines(event, dtstamp):
+    date_str = event["date"].strftime("%Y%m%d")
+    time_str = event["time"].strftime("%H%M%S") if event["time"] else DEFAULT_TIME
+
+    location = ics_escape(", ".join(part for part in (event["venue"], event["city"]) if part))
+
+    desc_lines = []
+    if event["description"]: desc_lines.append(event["description"])
+    if event["ticket_url"]: desc_lines.append(f"Piletid: {event['ticket_url']}")
+    if event["source_url"]: desc_lines.append(f"Allikas: {event['source_url']}")
+    description = ics_escape("\n\n".join(desc_lines))
+
+    return [
+        "BEGIN:VEVENT",
+        f"UID:{event_uid(event)}",
+        f"DTSTAMP:{dtstamp}",
+        f"DTSTART;TZID=Europe/Tallinn:{date_str}T{time_str}",
+        f"SUMMARY:{ics_escape(event['title'])}",
+        f"LOCATION:{location}",
+        f"DESCRIPTION:{description}",
+        f"URL:{event['source_url'] or ''}",
+        "END:VEVENT",
+    ]
+
+
+def calendar(vevents, name=None):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{PRODID}"]
+    if name:
+        lines += [
+            f"X-WR-CALNAME:{ics_escape(name)}",
+            # Hint for clients that honour it; the feed changes at most hourly
+            "REFRESH-INTERVAL;VALUE=DURATION:PT1H",
+            "X-PUBLISHED-TTL:PT1H",
+        ]
+    for vevent in vevents:
+        lines += vevent
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(fold_line(line) for line in lines) + "\r\n"
+
+
+def utc_stamp(value):
+    # updated_at is naive UTC (scraper_base.timestamp)
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def filter_rows(rows, genre=None, city=None):
+    genre = genre.strip().lower() if genre else None
+    city = city.strip().lower() if city else None
+    return [
+        row for row in rows
+        if (not genre or (row["genre"] or "").lower() == genre)
+        and (not city or (row["city"] or "").lower() == city)
+    ]
+
+
+def feed_name(window, genre=None, city=None):
+    return " / ".join(part for part in ("AG Kultuurivoog", genre, city, window) if part)
+
+
+def build_feed(rows, day, name):
+    """
+    Feed for `rows`. DTSTAMP is each event's updated_at, so the body (and
+    its ETag) only changes when the events do. Last-Modified is the build
+    time: the newest updated_at stays put when events leave the feed, and
+    a client polling with If-Modified-Since alone would keep them.
+    """
+    built_at = datetime.datetime.now(datetime.timezone.utc)
+    now = utc_stamp(built_at)
+    body = calendar(
+        (vevent_lines(row, utc_stamp(row["updated_at"]) if row.get("updated_at") else now) for row in rows),
+        name
+    ).encode("utf-8")
+    return Feed(
+        # mtime=0 keeps the compressed bytes stable for the same body
+        gz_body=gzip.compress(body, compresslevel=6, mtime=0),
+        etag=hashlib.sha1(body).hexdigest(),
+        last_modified=built_at,
+        day=day,
+        count=len(rows),
+        size=len(body),
+    )
+
+
+def decompressed_chunks(gz_body):
+    # For clients without gzip: inflate piecewise instead of all at once
+    inflater = zlib.decompressobj(31)
+    for offset in range(0, len(gz_body), STREAM_CHUNK_SIZE):
+        data = inflater.decompress(gz_body[offset:offset + STREAM_CHUNK_SIZE])
+        if data:
+            yield data
+    yield inflater.flush()
+
+
+class FeedStore:
+    """
+    LRU of built feeds keyed on (window, show_kids, genre, city).
+
+    refresh_data swaps in the prebuilt unfiltered feeds with replace();
+    filtered ones are built on first request. As with EventCache, a feed
+    built from rows read before a replace() is not stored, and feeds from
+    an earlier date count as missing.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.generation = 0
+        self._feeds = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None or feed.day != datetime.date.today():
+                return None
+            self._feeds.move_to_end(key)
+            return feed
+
+    def put(self, key, feed, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._feeds[key] = feed
+            self._feeds.move_to_end(key)
+            while len(self._feeds) > self.max_size:
+                self._feeds.popitem(last=False)
+
+    def replace(self, feeds):
+        with self._lock:
+            self.generation += 1
+            self._feeds = OrderedDict(feeds)
+
+    def stats(self):
+        feeds = list(self._feeds.values())
+        return {
+            "feeds": len(feeds),
+            "events": sum(feed.count for feed in feeds),
+            "bytes": sum(len(feed.gz_body) for feed in feeds),
+        }
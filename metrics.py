@@ -0,0 +1,207 @@
+"""
+Prometheus text-format metrics, served by /metrics.
+
+Only counters, gauges and histograms with labels, which is all the app
+needs, so no client library is required. Every metric registers itself in
+REGISTRY when created; render() writes them all out in exposition format
+0.0.4. Updates take a lock, so the scheduler thread and the request
+handlers can record into the same metrics.
+"""
+import time
+import threading
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; API requests are expected in the low milliseconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds; a refresh stage takes anywhere from milliseconds to minutes
+STAGE_BUCKETS = (0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+REGISTRY = []
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{format_labels(self.labelnames, key, extra)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, key, None, value) for key, value in items]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, key, None, value) for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        out = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                out.append((f"{self.name}_bucket", key, {"le": format_value(float(bound))}, cumulative))
+            out.append((f"{self.name}_bucket", key, {"le": "+Inf"}, count))
+            out.append((f"{self.name}_sum", key, None, total))
+            out.append((f"{self.name}_count", key, None, count))
+        return out
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# --- Metrics of this app ---
+
+HTTP_REQUESTS = Histogram(
+    "kv_http_request_duration_seconds", "API request latency until the last body byte, by route template",
+    ("method", "route", "status")
+)
+DB_QUERIES = Histogram(
+    "kv_db_query_duration_seconds", "Database query latency of the API read paths",
+    ("query",)
+)
+SOURCE_STAGES = Histogram(
+    "kv_source_stage_duration_seconds", "Time per scraper stage in one refresh, by source",
+    ("source", "stage"), buckets=STAGE_BUCKETS
+)
+REFRESH_STAGES = Histogram(
+    "kv_refresh_stage_duration_seconds", "Time per refresh_data step",
+    ("stage",), buckets=STAGE_BUCKETS
+)
+SCRAPE_RUNS = Counter(
+    "kv_scrape_runs_total", "Scraper runs by result (ok, blocked, error)",
+    ("source", "result")
+)
+SCRAPE_EVENTS = Counter(
+    "kv_scrape_events_total", "Events handled by the scrapers by outcome",
+    ("source", "outcome")
+)
+EVENTS = Gauge(
+    "kv_events", "Rows in events and the listing views (event_stats)",
+    ("set",)
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request until its response is fully
+    sent (streamed bodies included). The label is the route template, e.g.
+    /events/{event_id}/ics, so ids do not explode the label set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            if route is None:
+                route = "/static" if scope["path"].startswith("/static/") else "unmatched"
+            HTTP_REQUESTS.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=route, status=status[0]
+            )
@@ -0,0 +1,484 @@
+import os
+import re
+import hashlib
+import datetime
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import psycopg2
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import classifier
+import event_details
+import event_rules
+import event_store
+import html_engine
+import http_cache
+
+# Modules that register a Source when imported
+SOURCE_MODULES = ["scrape_teater_ee", "scrape_concert_ee"]
+
+# Wall-clock budget of one source run inside refresh_data, in seconds
+SCRAPER_TIMEOUT_DEFAULT = 300
+
+# Retried by Source.new_session(); a 403 or 429 is a block, retrying it only
+# digs deeper (TeaterSource retries them for its listing pages only)
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Politeness: concurrent requests per host and minimum gap between request starts
+SCRAPER_MAX_PER_HOST_DEFAULT = 2
+SCRAPER_HOST_DELAY_DEFAULT = 0.5
+
+BROWSER_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+MONTHS = {
+    "jaanuar": "01", "veebruar": "02", "märts": "03", "aprill": "04", "mai": "05", "juuni": "06",
+    "juuli": "07", "august": "08", "september": "09", "oktoober": "10", "november": "11", "detsember": "12"
+}
+
+# "P,  8. veebruar 2026", "8. veebruar 2026"
+DATE_RE = re.compile(r'(\d{1,2})\.\s+([a-zõäöü]+)\s+(\d{4})')
+
+
+def parse_estonian_full_date(date_str):
+    if not date_str: return None
+    match = DATE_RE.search(date_str.lower())
+    if not match: return None
+
+    day, month_name, year = match.groups()
+    if len(day) == 1: day = '0' + day
+    month = MONTHS.get(month_name)
+    if not month: return None
+
+    return f"{year}-{month}-{day}"
+
+
+# "Teisipäev, 10.02": listings of upcoming events that leave out the year
+DAY_MONTH_RE = re.compile(r'(?<![\d.])(\d{1,2})\.(\d{1,2})(?![\d.])')
+# A day/month this many days back is still this year's; older means next year
+DAY_MONTH_PAST_DAYS = 30
+
+
+def parse_day_month(date_str, today=None):
+    if not date_str: return None
+    match = DAY_MONTH_RE.search(date_str)
+    if not match: return None
+
+    day, month = int(match.group(1)), int(match.group(2))
+    today = today or datetime.date.today()
+    for year in (today.year, today.year + 1):
+        try:
+            candidate = datetime.date(year, month, day)
+        except ValueError:
+            continue
+        if candidate >= today - datetime.timedelta(days=DAY_MONTH_PAST_DAYS):
+            return candidate.isoformat()
+    return None
+
+
+def timestamp():
+    """Clock of updated_at, last_seen_at and created_at, and of the cleanup watermark.
+
+    Naive UTC: the columns are TIMESTAMP without a zone and the HTTP and
+    iCalendar layers read them as UTC whatever the host's zone is.
+    """
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def normalize_text(text):
+    if not text: return ""
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def generate_canonical_id(title, date_str, venue, city, time_str):
+    clean_time = time_str.replace(":", "") if time_str else ""
+    norm_title = normalize_text(title)
+    norm_venue = normalize_text(venue)
+    norm_city = normalize_text(city)
+
+    canonical_raw = f"{norm_title}|{date_str}|{norm_venue}|{norm_city}|{clean_time}"
+    return hashlib.sha1(canonical_raw.encode('utf-8')).hexdigest()
+
+
+def detect_genre(title, description, venue):
+    return classifier.CLASSIFIER.classify(title, venue, description).genre
+
+
+def detect_free(title, description):
+    result = classifier.CLASSIFIER.classify(title, "", description)
+    return result.is_free, result.free_reason
+
+
+def is_kids_event_check(title, venue, description):
+    return classifier.CLASSIFIER.classify(title, venue, description).is_kids_event
+
+
+def get_db_connection():
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("Error: DATABASE_URL not set")
+        return None
+    try:
+        return psycopg2.connect(db_url)
+    except Exception as e:
+        print(f"DB Connection Error: {e}")
+        return None
+
+
+class HostLimiter:
+    """Caps concurrent requests per host and spaces out their start times."""
+
+    def __init__(self, per_host, min_interval):
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._next_start = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            sem = self._slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+
+        with sem:
+            with self._lock:
+                now = time.monotonic()
+                start_at = max(now, self._next_start.get(host, 0))
+                self._next_start[host] = start_at + self.min_interval
+            if start_at > now:
+                time.sleep(start_at - now)
+            yield
+
+
+HTTP_CACHE = http_cache.HttpCache(
+    os.getenv("SCRAPER_CACHE_DIR", http_cache.HTTP_CACHE_DIR_DEFAULT),
+    enabled=os.getenv("SCRAPER_CACHE", "1") == "1"
+)
+
+HOST_LIMITER = HostLimiter(
+    per_host=int(os.getenv("SCRAPER_MAX_PER_HOST", SCRAPER_MAX_PER_HOST_DEFAULT)),
+    min_interval=float(os.getenv("SCRAPER_HOST_DELAY", SCRAPER_HOST_DELAY_DEFAULT))
+)
+
+
+def polite_get(session, url, **kwargs):
+    with HOST_LIMITER.slot(url):
+        return session.get(url, **kwargs)
+
+
+# Stages of Source.run, timed into stats["timings"] (seconds)
+RUN_STAGES = ("fetch", "parse", "details", "upsert")
+
+
+@contextmanager
+def timed(timings, stage):
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[stage] += time.monotonic() - started
+
+
+def timed_pages(pages, timings):
+    # Time spent waiting for the next page is the fetch stage
+    end = object()
+    while True:
+        with timed(timings, "fetch"):
+            page = next(pages, end)
+        if page is end:
+            return
+        yield page
+
+
+class FetchFailed(Exception):
+    """Raised by Source.fetch; the stats dict already says why."""
+
+
+class Source:
+    """
+    One event source. run() drives fetch -> parse -> enrich -> filter ->
+    persist, where filter drops non-events (see event_rules).
+
+    Subclasses set `name`, implement select_blocks() and extract_event()
+    (the two halves of parse(), written against the html_engine node API)
+    plus either fetch() (single page) or
+    fetch_pages() (a generator of pages). Each page is parsed and
+    written as soon as it arrives, so a long crawl never holds the whole
+    listing in memory. parse() must not touch the network or the database
+    so it can run against saved HTML.
+
+    Pages are HTML strings or http_cache.Page objects; a Page that is
+    unchanged since the last successful run is skipped without parsing.
+    Events coming out of parse() are plain dicts with title, date (ISO),
+    time, venue, city, image_url, source_url and optionally description and
+    ticket_url. enrich() adds classification, canonical id and timestamps.
+    """
+
+    name = None
+    # Columns refreshed when an event is seen again
+    update_columns = []
+    # Marker printed with the parsed count, kept for the workflow logs
+    parsed_label = "TOTAL_PARSED"
+    timeout = float(os.getenv("SCRAPER_TIMEOUT", SCRAPER_TIMEOUT_DEFAULT))
+    # Cap on events taken from one page, None for no cap
+    max_events = None
+
+    http_cache = HTTP_CACHE
+    html_parser = html_engine.resolve_engine()
+
+    # Detail pages (event_details); headers for fetch_detail()
+    fetch_details = os.getenv("SCRAPER_DETAILS", "1") == "1"
+    detail_headers = {"User-Agent": BROWSER_USER_AGENT}
+    _detail_session = None
+    _detail_session_lock = threading.Lock()
+
+    def new_stats(self):
+        return {
+            "parsed": 0, "inserted": 0, "updated": 0, "unchanged": 0, "filtered": 0,
+            "details_cached": 0, "details_fetched": 0,
+            "error": None, "blocked": False, "status": 0,
+            "cache_hit": False
+        }
+
+    def fetch(self, stats):
+        raise NotImplementedError
+
+    def fetch_pages(self, stats):
+        yield self.fetch(stats)
+
+    def build_document(self, html):
+        return html_engine.parse_document(html, self.html_parser)
+
+    def select_blocks(self, doc):
+        """Yield one item per candidate event; passed to extract_event()."""
+        raise NotImplementedError
+
+    def extract_event(self, item):
+        """Return the event dict for one item, or None to skip it."""
+        raise NotImplementedError
+
+    def parse(self, html):
+        events = []
+        for item in self.select_blocks(self.build_document(html)):
+            if self.max_events is not None and len(events) >= self.max_events: break
+            try:
+                event = self.extract_event(item)
+            except Exception:
+                # One malformed block must not lose the rest of the page
+                continue
+            if event: events.append(event)
+        return events
+
+    def new_session(self, pool_size=1, retry_statuses=RETRY_STATUSES):
+        """Keep-alive session retrying connection errors and `retry_statuses`."""
+        session = requests.Session()
+        retries = Retry(
+            total=2,
+            backoff_factor=1,  # 1s, 2s
+            status_forcelist=list(retry_statuses),
+            allowed_methods=["GET"]
+        )
+        adapter = HTTPAdapter(max_retries=retries, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def detail_session(self):
+        # One connection pool for all detail pages of a run, shared by the
+        # worker threads of event_details
+        with self._detail_session_lock:
+            if self._detail_session is None:
+                concurrency = int(os.getenv("DETAIL_CONCURRENCY", event_details.DETAIL_CONCURRENCY_DEFAULT))
+                self._detail_session = self.new_session(pool_size=concurrency, retry_statuses=RETRY_STATUSES)
+            return self._detail_session
+
+    def fetch_detail(self, url):
+        """(status, body) of an event's detail page; runs in worker threads."""
+        response = polite_get(self.detail_session(), url, headers=self.detail_headers, timeout=20)
+        return response.status_code, response.text
+
+    def extract_details(self, doc, url):
+        return event_details.extract_details(doc, url)
+
+    def classify(self, events):
+        results = classifier.classify_many(
+            [(ev["title"], ev["venue"], ev["description"]) for ev in events]
+        )
+        for event, result in zip(events, results):
+            event["genre"] = result.genre
+            event["is_kids_event"] = result.is_kids_event
+            event["is_free"] = result.is_free
+            event["free_reason"] = result.free_reason
+
+    def enrich(self, events):
+        current_time = timestamp().isoformat()
+
+        for event in events:
+            event.setdefault("venue", "")
+            event.setdefault("city", "")
+            event.setdefault("time", None)
+            event.setdefault("description", "")
+            event.setdefault("image_url", "")
+            event.setdefault("ticket_url", "")
+            event.setdefault("source_url", "")
+
+        # One classifier pass for the whole page
+        self.classify(events)
+
+        for event in events:
+            event["canonical_event_id"] = generate_canonical_id(
+                event["title"], event["date"], event["venue"], event["city"], event["time"]
+            )
+            event["source"] = self.name
+            event["last_seen_at"] = current_time
+            event["created_at"] = current_time
+            event["updated_at"] = current_time
+        return events
+
+    def persist(self, conn, events):
+        return event_store.upsert_events(conn, events, self.update_columns)
+
+    def run(self):
+        stats = self.new_stats()
+
+        conn = get_db_connection()
+        if not conn:
+            stats["error"] = "No DB connection"
+            return stats
+
+        timings = dict.fromkeys(RUN_STAGES, 0.0)
+        try:
+            pages = self.fetch_pages(stats)
+            fetched = 0
+            unchanged = 0
+            try:
+                for page in timed_pages(pages, timings):
+                    fetched += 1
+                    cached_page = page if isinstance(page, http_cache.Page) else None
+                    if cached_page is not None:
+                        if cached_page.unchanged:
+                            unchanged += 1
+                            self.http_cache.commit(cached_page)
+                            continue
+                        page = cached_page.text
+
+                    with timed(timings, "parse"):
+                        events = self.enrich(self.parse(page))
+                        stats["parsed"] += len(events)
+
+                        # Galleries, recaps etc. never reach the database
+                        events, dropped = event_rules.filter_events(events)
+                        stats["filtered"] += sum(dropped.values())
+
+                    if self.fetch_details:
+                        max_fetches = int(os.getenv("DETAIL_MAX_FETCHES", event_details.DETAIL_MAX_FETCHES_DEFAULT))
+                        with timed(timings, "details"):
+                            details = event_details.enrich_details(
+                                conn, self, events, max_fetches - stats["details_fetched"]
+                            )
+                        stats["details_cached"] += details["cached"]
+                        stats["details_fetched"] += details["fetched"]
+
+                    with timed(timings, "upsert"):
+                        written = self.persist(conn, events)
+                        conn.commit()
+                    stats["inserted"] += written["inserted"]
+                    stats["updated"] += written["updated"]
+                    stats["unchanged"] += written["unchanged"]
+
+                    if cached_page is not None:
+                        self.http_cache.commit(cached_page)
+            except FetchFailed:
+                return stats
+            except Exception as e:
+                print(f"Page processing error: {e}")
+                conn.rollback()
+                stats["error"] = str(e)
+                return stats
+            finally:
+                pages.close()
+                stats["timings"] = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+                stats["cache_hits"] = unchanged
+                stats["cache_hit"] = fetched > 0 and unchanged == fetched
+
+            if stats["cache_hit"]:
+                print(f"CACHE_HIT: true ({self.name})")
+            print(f"{self.parsed_label}: {stats['parsed']}")
+            print(f"INSERTED: {stats['inserted']}")
+            print(f"UPDATED: {stats['updated']}")
+            print(f"UNCHANGED: {stats['unchanged']}")
+            print(f"FILTERED_NON_EVENTS: {stats['filtered']}")
+            if self.fetch_details:
+                print(f"DETAILS_FETCHED: {stats['details_fetched']} (cached {stats['details_cached']})")
+            if stats["parsed"] and stats["filtered"] == stats["parsed"]:
+                # A rule matching a whole listing is a broken rule, not a page of non-events
+                print(f"ALL_EVENTS_FILTERED: true ({self.name})")
+                stats["error"] = "Every parsed event was filtered as a non-event"
+            return stats
+        finally:
+            conn.close()
+            if self._detail_session is not None:
+                self._detail_session.close()
+                self._detail_session = None
+
+
+SOURCES = {}
+
+
+def register_source(cls):
+    SOURCES[cls.name] = cls
+    return cls
+
+
+def load_sources():
+    for module in SOURCE_MODULES:
+        importlib.import_module(module)
+    return [SOURCES[name]() for name in SOURCES]
+
+
+def run_source(source):
+    started = time.monotonic()
+    try:
+        stats = source.run()
+    except Exception as e:
+        stats = source.new_stats()
+        stats["error"] = str(e)
+    stats["duration"] = round(time.monotonic() - started, 3)
+    return stats
+
+
+def run_sources(sources):
+    """
+    Run sources in parallel threads, one per source, and return
+    {name: stats}. A source that exceeds its `timeout` is reported as an
+    error; its thread cannot be killed and finishes in the background, but
+    the caller no longer waits for it.
+    """
+    if not sources:
+        return {}
+
+    executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="scraper")
+    started = time.monotonic()
+    futures = [(source, executor.submit(run_source, source)) for source in sources]
+
+    results = {}
+    for source, future in futures:
+        remaining = max(0, started + source.timeout - time.monotonic())
+        try:
+            results[source.name] = future.result(timeout=remaining)
+        except FutureTimeout:
+            print(f"SOURCE_TIMEOUT: {source.name}")
+            stats = source.new_stats()
+            stats["error"] = f"Timed out after {source.timeout:.0f}s"
+            stats["duration"] = round(time.monotonic() - started, 3)
+            results[source.name] = stats
+
+    executor.shutdown(wait=False)
+    return results
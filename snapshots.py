@@ -0,0 +1,85 @@
+import datetime
+import hashlib
+import threading
+from collections import namedtuple
+
+import orjson
+
+# Standard time windows served by /events/<name>, in days from today
+WINDOWS = {
+    "today": 0,
+    "7days": 7,
+    "14days": 14,
+    "30days": 30
+}
+
+SNAPSHOT_MAX_AGE_DEFAULT = 60
+
+Snapshot = namedtuple("Snapshot", ["body", "etag", "last_modified", "day", "count"])
+
+
+def window_bounds(name, today=None):
+    today = today or datetime.date.today()
+    return today, today + datetime.timedelta(days=WINDOWS[name])
+
+
+def encode_events(rows):
+    # orjson writes date/time as ISO strings, same as FastAPI's jsonable_encoder
+    return orjson.dumps(rows)
+
+
+def make_etag(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def build_snapshot(rows, day):
+    # Last-Modified is when the snapshot was built: the newest updated_at in
+    # the window does not move when rows leave it (day rollover, cleanup,
+    # dedup) or older rows slide in, so it would answer wrong 304s
+    body = encode_events(rows)
+    return Snapshot(
+        body=body, etag=make_etag(body), last_modified=datetime.datetime.now(datetime.timezone.utc),
+        day=day, count=len(rows)
+    )
+
+
+class SnapshotStore:
+    """
+    Ready-to-send JSON bodies for WINDOWS x show_kids.
+
+    refresh_data swaps in a whole new set at once; snapshots built for an
+    earlier date are treated as missing so the windows roll over at midnight.
+
+    `generation` returns the current EventCache generation. A snapshot built
+    on demand is stored only if that has not moved since its query started,
+    so a query that overlapped a refresh cannot replace the fresh snapshot.
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, window, show_kids):
+        snap = self._snapshots.get((window, show_kids))
+        if snap is None or snap.day != datetime.date.today():
+            return None
+        return snap
+
+    def put(self, window, show_kids, snap, generation):
+        with self._lock:
+            if generation != self.generation():
+                return False
+            self._snapshots[(window, show_kids)] = snap
+            return True
+
+    def replace(self, snapshots):
+        with self._lock:
+            self._snapshots = dict(snapshots)
+
+    def stats(self):
+        snaps = self._snapshots
+        return {
+            f"{window}{'_kids' if show_kids else ''}": {"count": snap.count, "bytes": len(snap.body)}
+            for (window, show_kids), snap in snaps.items()
+        }
@@ -0,0 +1,52 @@
+import os
+
+import event_rules
+import scrape_concert_ee
+
+DUMP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "concert_dump.html")
+
+# A news teaser as concert.ee lists them next to the concerts
+NEWS_TEASER = """
+<div class="col">
+  <div class="date">8.02</div>
+  <h3><a href="https://concert.ee/saaremaa-ooperipaevade-peaprodutsent-on-priit-mikk/">Saaremaa ooperipäevade peaprodutsent on Priit Mikk</a></h3>
+</div>
+"""
+
+
+def concert_events(html):
+    source = scrape_concert_ee.ConcertSource()
+    source.max_events = None
+    return source.enrich(source.parse(html))
+
+
+def test_concert_news_teaser_is_dropped():
+    events = concert_events(NEWS_TEASER)
+    assert len(events) == 1
+    kept, dropped = event_rules.filter_events(events)
+    assert kept == []
+    assert dropped == {"concert_without_time": 1}
+
+
+def test_concerts_in_dump_are_kept():
+    events = concert_events(open(DUMP, encoding="utf-8").read())
+    assert events
+    assert all(ev["time"] and ev["venue"] and ev["city"] for ev in events)
+    kept, dropped = event_rules.filter_events(events)
+    assert len(kept) == len(events)
+    assert dropped == {}
+
+
+def test_concert_page_without_time_is_kept():
+    event = {
+        "source": "concert.ee", "genre": "Kontsert", "title": "Eplik ja Randalu", "time": None,
+        "source_url": "https://concert.ee/kontsert/eplik-randalu-ja-new-wind-jazz-orchestra/?ek_id=5028",
+    }
+    assert event_rules.non_event_rule(event) is None
+    assert event_rules.non_event_rule(dict(event, source_url="https://concert.ee/eesti-kontserdi-kinkepilet/")) == "concert_without_time"
+
+
+def test_missing_time_sql_matches_python():
+    clause, params = event_rules.MissingTimeRule("r", "concert.ee", "Kontsert", event_rules.CONCERT_PAGE_URL).sql()
+    assert "!~" in clause
+    assert params == ["concert.ee", "Kontsert", event_rules.CONCERT_PAGE_URL]